@@ -38,4 +38,13 @@ def create_app(config_name, logger):
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    from .main import pool, sampling, target_plot, response_cache, jobs, metrics, nights
+    pool.init_app(app)
+    metrics.init_app(app)
+    jobs.init_app(app)
+    sampling.init_app(app)
+    target_plot.init_app(app)
+    response_cache.init_app(app)
+    nights.init_app(app)
+
     return app
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 main = Blueprint('main', __name__)
 
-from . import routes
\ No newline at end of file
+from . import routes, api
\ No newline at end of file
@@ -15,6 +15,11 @@ from qplan.plots import airmass
 
 from ginga.misc import Bunch
 
+try:
+    from . import sampling
+except:
+    import sampling
+
 
 class AirMassPlot2(airmass.AirMassPlot):
 
@@ -23,26 +28,71 @@ class AirMassPlot2(airmass.AirMassPlot):
                                           logger=logger)
 
 
-    def plot_altitude(self, site, tgt_data, tz):
-        self._plot_altitude(self.fig, site, tgt_data, tz)
+    def plot_altitude(self, site, tgt_data, tz, draw=True):
+        self._plot_altitude(self.fig, site, tgt_data, tz, draw=draw)
+
+    def plot_visibility(self, ctx, tgt_data, almanac, draw=True):
+        """
+        Plot the targets in `tgt_data` (Bunches of tgt_calc and tgt_info,
+        as for TargetPlot) for the night of observing context `ctx`,
+        using the night's `almanac` for the twilight.  Pass draw=False
+        if the figure is rendered by savefig, which draws it anyway.
+        """
+        tz = ctx.tz
+        lt_data = [dt.astimezone(tz) for dt in tgt_data[0].tgt_calc.lt]
+
+        curves = []
+        for t in tgt_data:
+            curves.append(Bunch.Bunch(name=t.tgt_info.name, ra=t.tgt_info.ra, dec=t.tgt_info.dec,
+                                      alt_data=numpy.asarray(t.tgt_calc.alt_deg),
+                                      moon_sep=numpy.asarray(t.tgt_calc.moon_sep)))
+
+        moon_data = numpy.asarray(tgt_data[0].tgt_calc.moon_alt)
+        moon_illum = ctx.site.moon_phase(date=lt_data[moon_data.argmax()])
 
+        ax1 = self._plot_curves(self.fig, lt_data, curves, moon_data, moon_illum, tz)
+        self._draw_twilight(ax1, almanac, tz)
+        self._finish(ax1, lt_data, tz, draw)
 
-    def _plot_altitude(self, figure, site, tgt_data, tz):
+    def _plot_altitude(self, figure, site, tgt_data, tz, draw=True):
         """
         Plot into `figure` an altitude chart using target data from `info`
         with time plotted in timezone `tz` (a tzinfo instance).
         """
         ## site = info.site
         ## tgt_data = info.target_data
-        # Urk! This seems to be necessary even though we are plotting
-        # python datetime objects with timezone attached and setting
-        # date formatters with the timezone
-        tz_str = tz.tzname(None)
-        mpl.rcParams['timezone'] = tz_str
+        lt_data = list(map(lambda info: info.ut.astimezone(tz),
+                      tgt_data[0].history))
+        # sanity check on dates in preferred timezone
+        ## for dt in lt_data[:10]:
+        ##     print(dt.strftime("%Y-%m-%d %H:%M:%S"))
+
+        curves = []
+        for info in tgt_data:
+            curves.append(Bunch.Bunch(name=info.target.name, ra=info.target.ra, dec=info.target.dec,
+                                      alt_data=numpy.array([i.alt_deg for i in info.history]),
+                                      moon_sep=numpy.array([i.moon_sep for i in info.history])))
+
+        # Plot moon trajectory and illumination
+        moon_data = numpy.array(list(map(lambda info: info.moon_alt,
+                                    tgt_data[0].history)))
+        illum_time = lt_data[moon_data.argmax()]
+        moon_illum = site.moon_phase(date=illum_time)
+
+        ax1 = self._plot_curves(figure, lt_data, curves, moon_data, moon_illum, tz)
+        self._plot_twilight(ax1, site, tz)
+        self._finish(ax1, lt_data, tz, draw)
 
+    def _plot_curves(self, figure, lt_data, curves, moon_data, moon_illum, tz):
+        """
+        Plot into `figure` the altitude `curves` of the targets and the
+        moon over the local times `lt_data`.  Returns the altitude axes.
+        """
+        # the locators and formatters get the timezone explicitly instead
+        # of through mpl.rcParams['timezone'], which is process-wide
         # set major ticks to hours
         majorTick = mpl_dt.HourLocator(tz=tz)
-        majorFmt = mpl_dt.DateFormatter('%Hh')
+        majorFmt = mpl_dt.DateFormatter('%Hh', tz=tz)
         # set minor ticks to 15 min intervals
         minorTick = mpl_dt.MinuteLocator(list(range(0,59,15)), tz=tz)
 
@@ -53,49 +103,36 @@ class AirMassPlot2(airmass.AirMassPlot):
 
         #lstyle = 'o'
         lstyle = '-'
-        lt_data = list(map(lambda info: info.ut.astimezone(tz),
-                      tgt_data[0].history))
-        # sanity check on dates in preferred timezone
-        ## for dt in lt_data[:10]:
-        ##     print(dt.strftime("%Y-%m-%d %H:%M:%S"))
-
 
-        min_interval = 12  # hour/5min
+        min_interval = sampling.marker_step(lt_data)  # every ~1 hr
         mt = lt_data[0:-1:min_interval]
         targets = []
         legend = [] 
 
 
         # plot targets elevation vs. time
-        for i, info in enumerate(tgt_data):
-            alt_data = numpy.array(list(map(lambda info: info.alt_deg, info.history)))
-            alt_min = numpy.argmin(alt_data)
-            alt_data_dots = alt_data
+        for i, info in enumerate(sorted(curves, key=lambda c: c.name)):
+            alt_data = info.alt_data
             color = self.colors[i % len(self.colors)]
             lc = color + lstyle
-            # ax1.plot_date(lt_data, alt_data, lc, linewidth=1.0, alpha=0.3, aa=True, tz=tz)
-            ax1.plot_date(lt_data, alt_data_dots, lc, linewidth=2.0,
-                          aa=True, tz=tz)
-
-            legend.extend(ax1.plot_date(lt_data, alt_data_dots, lc, linewidth=2.0,aa=True, tz=tz))   
-            targets.append("{0} {1} {2}".format(info.target.name, info.target.ra, info.target.dec))
+            legend.extend(ax1.plot(lt_data, alt_data, lc, linewidth=2.0, aa=True))
+            targets.append("{0} {1} {2}".format(info.name, info.ra, info.dec))
 
             alt_interval = alt_data[0:-1:min_interval]
-            moon_sep = numpy.array(map(lambda info: info.moon_sep, info.history))
-            moon_sep = moon_sep[0:-1:min_interval]
+            moon_sep = info.moon_sep[0:-1:min_interval]
 
             # plot moon separations 
             for x, y, v in zip(mt, alt_interval, moon_sep):
                 if y < 0:
                     continue
                 ax1.text(x, y, '%.1f' %v, fontsize=7,  ha='center', va='bottom')
-                ax1.plot_date(x, y, 'ko', ms=3)
+                ax1.plot(x, y, 'ko', ms=3)
 
             #xs, ys = mpl.mlab.poly_between(lt_data, 2.02, alt_data)
             #ax1.fill(xs, ys, facecolor=self.colors[i], alpha=0.2)
 
             # plot object label
-            targname = info.target.name
+            targname = info.name
             ax1.text(mpl_dt.date2num(lt_data[alt_data.argmax()]),
                      alt_data.max() + 4.0, targname, color=color,
                      ha='center', va='center')
@@ -119,7 +156,7 @@ class AirMassPlot2(airmass.AirMassPlot):
         #x = mpl_dt.date2num(lt_data[len(lt_data)/2])
 
          # legend target list
-        self.fig.legend(legend, sorted(targets), 'upper right', fontsize=9, framealpha=0.5, frameon=True, ncol=1, bbox_to_anchor=[0.3, 0.865, .7, 0.1])
+        figure.legend(legend, targets, loc='upper right', fontsize=9, framealpha=0.5, frameon=True, ncol=1, bbox_to_anchor=[0.3, 0.865, .7, 0.1])
 
 
         ax1.set_ylim(0.0, 90.0)
@@ -134,18 +171,15 @@ class AirMassPlot2(airmass.AirMassPlot):
         localdate = lt_data[0].astimezone(tz).strftime("%Y-%m-%d")
         title = 'Visibility for the night of %s' % (localdate)
         ax1.set_title(title)
-        ax1.set_xlabel(tz.tzname(None))
+        ax1.set_xlabel(lt_data[0].tzname())
         ax1.set_ylabel('Altitude')
 
         # Plot moon trajectory and illumination
-        moon_data = numpy.array(list(map(lambda info: info.moon_alt,
-                                    tgt_data[0].history)))
         illum_time = lt_data[moon_data.argmax()]
-        moon_illum = site.moon_phase(date=illum_time)
         moon_color = '#666666'
         moon_name = "Moon (%.2f %%)" % (moon_illum*100)
-        ax1.plot_date(lt_data, moon_data, moon_color, linewidth=2.0,
-                      alpha=0.5, aa=True, tz=tz)
+        ax1.plot(lt_data, moon_data, moon_color, linewidth=2.0,
+                 alpha=0.5, aa=True)
         ax1.text(mpl_dt.date2num(illum_time),
                  moon_data.max() + 4.0, moon_name, color=moon_color,
                  ha='center', va='center')
@@ -168,26 +202,21 @@ class AirMassPlot2(airmass.AirMassPlot):
         ## mxs, mys = mpl.mlab.poly_between(lt_data, 0, moon_data)
         ## # ax2.fill(mxs, mys, facecolor='#666666', alpha=moon_illum)
 
-        # plot moon label
-        targname = "moon"
-        ## ax1.text(mpl_dt.date2num(moon_data[moon_data.argmax()]),
-        ##          moon_data.max() + 0.08, targname.upper(), color=color,
-        ##          ha='center', va='center')
-
         # plot lower and upper safe limits for clear observing
         min_alt, max_alt = 30.0, 75.0
         self._plot_limits(ax1, min_alt, max_alt)
 
-        self._plot_twilight(ax1, site, tz)
+        return ax1
 
+    def _finish(self, ax, lt_data, tz, draw=True):
         # plot current hour
         lo = datetime.now(tz)
         hi = lo + timedelta(0, 3600.0)
         if lt_data[0] < lo < lt_data[-1]:
-            self._plot_current_time(ax1, lo, hi)
+            self._plot_current_time(ax, lo, hi)
 
         canvas = self.fig.canvas
-        if canvas is not None:
+        if draw and canvas is not None:
             canvas.draw()
 
         # draw target's name
@@ -195,15 +224,35 @@ class AirMassPlot2(airmass.AirMassPlot):
         #    tgt = "{2} {0} {1}".format(t.target.ra, t.target.dec, t.target.name)
         #    ax1.text(0, -1, tgt)
 
-
     def _plot_twilight(self, ax, site, tz):
         # plot sunset
         t = site.sunset().astimezone(tz)
 
-        # plot evening twilight 6/12/18 degrees
-        et6 = site.evening_twilight_6(t).astimezone(tz)
-        et12 = site.evening_twilight_12(t).astimezone(tz)
-        et18 = site.evening_twilight_18(t).astimezone(tz)
+        # evening and morning twilight 6/12/18 degrees
+        et6 = site.evening_twilight_6(t)
+        et12 = site.evening_twilight_12(t)
+        et18 = site.evening_twilight_18(t)
+        mt18 = site.morning_twilight_18(et18)
+
+        times = Bunch.Bunch(sunset=t, et6=et6, et12=et12, et18=et18,
+                            mt6=site.morning_twilight_6(et6),
+                            mt12=site.morning_twilight_12(et12),
+                            mt18=mt18,
+                            # plot sunrise
+                            sunrise=site.sunrise(mt18))
+
+        self._draw_twilight(ax, times, tz)
+
+    def _draw_twilight(self, ax, times, tz):
+        """
+        Shade the twilight bands and mark sunset, sunrise and the middle
+        of the night given by `times`, a Bunch or almanac with sunset,
+        et6/12/18, mt6/12/18 and sunrise.
+        """
+        t = times.sunset.astimezone(tz)
+        et6 = times.et6.astimezone(tz)
+        et12 = times.et12.astimezone(tz)
+        et18 = times.et18.astimezone(tz)
 
         #n, n2 = list(map(mpl_dt.date2num, [t, t2]))
         ymin, ymax = ax.get_ylim()
@@ -223,16 +272,15 @@ class AirMassPlot2(airmass.AirMassPlot):
         nautical_twi = "Nautical Twi {}".format(et12.strftime("%H:%M:%S"))
         astro_twi = "Astronomical Twi {}".format(et18.strftime("%H:%M:%S"))
 
-        self.fig.legend((ss, ct, nt, at), (sunset, civil_twi, nautical_twi, astro_twi), 'upper left', fontsize=7,  framealpha=0.5,  bbox_to_anchor=[0.045, -0.02, .7, 0.113])
+        self.fig.legend((ss, ct, nt, at), (sunset, civil_twi, nautical_twi, astro_twi), loc='upper left', fontsize=7,  framealpha=0.5,  bbox_to_anchor=[0.045, -0.02, .7, 0.113])
         #self.ax3.legend((ss, etw), (sunset, e_twilight), 'upper left', fontsize='small',  framealpha=0.5)
 
-        # plot morning twilight 6/12/18 degrees
-        mt6 = site.morning_twilight_6(et6).astimezone(tz)
-        mt12 = site.morning_twilight_12(et12).astimezone(tz)
-        mt18= site.morning_twilight_18(et18).astimezone(tz)
+        # morning twilight 6/12/18 degrees
+        mt6 = times.mt6.astimezone(tz)
+        mt12 = times.mt12.astimezone(tz)
+        mt18 = times.mt18.astimezone(tz)
 
-        # plot sunrise
-        t2 = site.sunrise(mt18).astimezone(tz)
+        t2 = times.sunrise.astimezone(tz)
 
         # astronomical twilight 18 degree
         at = ax.axvspan(mt18, mt12, facecolor='#3949AB', lw=None, ec='none', alpha=0.65)
@@ -350,7 +398,7 @@ if __name__ == '__main__':
 
     ## info = Bunch.Bunch(site=site, num_tgts=num_tgts,
     ##                    target_data=target_data)
-    plot.plot_altitude(site, target_data, tz)
+    plot.plot_altitude(site, target_data, tz, draw=outfile is None)
 
     if outfile == None:
         topw.show()
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+
+from ginga.misc import Bunch
+
+try:
+    from .cache import LRUCache
+    from . import ephemeris
+except:
+    from cache import LRUCache
+    import ephemeris
+
+# nights kept; traffic is mostly about tonight and tomorrow
+ALMANAC_CACHE_SIZE = 32
+
+_cache = LRUCache(maxsize=ALMANAC_CACHE_SIZE)
+
+
+def cache_stats():
+    return _cache.stats()
+
+def format_hms(h, m, s):
+    return f"{int(h):02d}:{int(m):02d}:{s:04.1f}"
+
+def format_dms(sign, d, m, s):
+    return f"{sign}{abs(int(d)):02d}:{int(m):02d}:{s:04.1f}"
+
+def compute_almanac(site, noon, logger):
+    """
+    Compute sunset/sunrise, twilights and the moon position at midnight
+    for the night beginning at the evening of `noon`.
+    """
+    logger.debug("computing almanac for %s %s", site.name, noon.date())
+
+    sunset = site.sunset(noon)
+    sunrise = site.sunrise(noon)
+    logger.debug("Sunset: %s, Sunrise: %s", sunset, sunrise)
+
+    local_timezone = site.tz_local
+    today_midnight = datetime(noon.year, noon.month, noon.day, 0, 0, 0,
+                              tzinfo=local_timezone)
+    midnight = today_midnight + timedelta(days=1)
+
+    utc_dt = (midnight + timedelta(hours=10)).replace(tzinfo=timezone.utc)
+    t = ephemeris.timescale().from_datetime(utc_dt)
+
+    astrometric = ephemeris.location(site).at(t).observe(ephemeris.body('moon')).apparent()
+    ra, dec, distance = astrometric.radec()
+
+    h, m, s = ra.hms()
+    sign_num, d, mm, ss = dec.signed_dms()
+    sign = "+" if sign_num >= 0 else "-"
+
+    return Bunch.Bunch(date=noon.date(),
+                       sunset=sunset, sunrise=sunrise,
+                       et6=site.evening_twilight_6(sunset),
+                       et12=site.evening_twilight_12(sunset),
+                       et18=site.evening_twilight_18(sunset),
+                       mt18=site.morning_twilight_18(sunset),
+                       mt12=site.morning_twilight_12(sunset),
+                       mt6=site.morning_twilight_6(sunset),
+                       midnight=midnight,
+                       moon_ra=format_hms(h, m, s),
+                       moon_dec=format_dms(sign, d, mm, ss))
+
+def obsdate_noon(ctx, tz):
+    """
+    Return noon (in `tz`) of the DAY on which the observation in `ctx`
+    begins at sunset. So, for example, at 3:00 (AM) it is noon on the
+    day BEFORE.
+    """
+    dt = ctx.date.astimezone(tz)
+
+    # noon and midnight on the current date
+    noon = dt.replace(hour=12, minute=0, second=0, microsecond=0)
+    prev_noon = noon - timedelta(hours=24)
+    prev_midnight = noon - timedelta(hours=12)
+
+    # sunrise is always before noon, so only a morning time needs it
+    if dt < noon and dt < ctx.site.sunrise(prev_midnight):
+        # it's not yet daytime on this date
+        noon = prev_noon
+
+    return noon
+
+def night_almanac(ctx, logger):
+    """Return the almanac for the night observed in `ctx`."""
+    return get_almanac(ctx.site, obsdate_noon(ctx, ctx.tz), logger)
+
+def get_almanac(site, noon, logger):
+    """
+    Return the almanac for `site` and the night beginning at `noon`,
+    computing it only if it is not already cached.
+    """
+    key = (site.name, noon.date())
+    almanac = _cache.get(key)
+    if almanac is None:
+        almanac = compute_almanac(site, noon, logger)
+        _cache.put(key, almanac)
+    return almanac
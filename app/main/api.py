@@ -0,0 +1,150 @@
+import io
+
+import numpy as np
+
+from flask import request, jsonify, make_response, current_app
+from flask import current_app as app
+
+from . import main
+from . import helper_func as helper
+from . import observability
+from .context import observing_context
+from .almanac import night_almanac
+from .image import IMAGE_FORMATS, image_size, render_visibility
+from .response_cache import cached_response
+
+# Machine-readable counterparts of the /text, /csv and /ope pages.  They
+# take the same form fields and return the computed grid instead of a
+# plot, either as columnar JSON or, with format=npz, as NumPy arrays.
+# format=png|svg returns the visibility chart as a static image instead,
+# and format=summary only the per-target observability numbers.
+
+
+def _almanac_dict(almanac):
+    res = {}
+    for key, val in almanac.items():
+        res[key] = val.isoformat() if hasattr(val, 'isoformat') else val
+    return res
+
+def _epoch_ms(dts):
+    return np.array([int(dt.timestamp() * 1000) for dt in dts], dtype=np.int64)
+
+def _column(arr, decimals=2):
+    """Rounded nested lists for JSON, with NaN (e.g. airmass below the horizon) as null."""
+    return np.where(np.isnan(arr), None, np.round(arr, decimals)).tolist()
+
+def _bad_request(errors):
+    return make_response(jsonify(errors=errors), 400)
+
+def _grid_response(target_list, mysite, mydate):
+
+    if mysite is None or not mydate:
+        return _bad_request(['site and date are required'])
+
+    ctx = observing_context(mysite, mydate)
+    valid, batch, errors = helper.compute_targets(target_list, ctx, app.logger,
+                                                  request.values.get('time_interval'))
+    almanac = night_almanac(ctx, app.logger)
+
+    names = [t.name for t in valid]
+    ra = [t.ra for t in valid]
+    dec = [t.dec for t in valid]
+
+    if batch is None:
+        time = np.empty(0, dtype=np.int64)
+        alt_deg = airmass = moon_sep = np.empty((0, 0))
+        moon_alt = np.empty(0)
+    else:
+        time = _epoch_ms(batch.ut)
+        alt_deg, airmass, moon_sep = batch.alt_deg, batch.airmass, batch.moon_sep
+        moon_alt = batch.moon_alt
+
+    fmt = request.values.get('format', 'json').lower()
+
+    if fmt in IMAGE_FORMATS:
+        if batch is None:
+            return _bad_request(errors or ['no valid targets'])
+        width, height = image_size(request.values.get('width'), request.values.get('height'))
+        img = render_visibility(ctx, helper.target_data(valid, batch), almanac, fmt=fmt,
+                                width=width, height=height, logger=app.logger)
+        response = make_response(img)
+        response.headers['Content-Type'] = IMAGE_FORMATS[fmt]
+        return response
+
+    if fmt == 'summary':
+        # per-target numbers only; times in ms since the epoch
+        columns = {}
+        if batch is not None:
+            res = observability.summarize(batch, almanac)
+            columns = {col: _column(res[col] * 1000 if col in ('rise', 'set', 'highest') else res[col], 3)
+                       for col in observability.COLUMNS[3:]}
+        return jsonify(site=ctx.name, date=mydate, tz=str(ctx.tz),
+                       targets=dict(name=names, ra=ra, dec=dec, **columns),
+                       almanac=_almanac_dict(almanac),
+                       errors=errors)
+
+    if fmt == 'npz':
+        buf = io.BytesIO()
+        np.savez_compressed(buf, time=time, name=np.array(names, dtype=str),
+                            ra=np.array(ra, dtype=str), dec=np.array(dec, dtype=str),
+                            alt_deg=alt_deg, airmass=airmass, moon_sep=moon_sep,
+                            moon_alt=moon_alt)
+        response = make_response(buf.getvalue())
+        response.headers['Content-Type'] = 'application/octet-stream'
+        response.headers['Content-Disposition'] = f'attachment; filename=visibility-{mydate}.npz'
+        return response
+
+    return jsonify(site=ctx.name, date=mydate, tz=str(ctx.tz),
+                   time=time.tolist(),
+                   targets=dict(name=names, ra=ra, dec=dec),
+                   alt_deg=_column(alt_deg), airmass=_column(airmass, 3),
+                   moon_sep=_column(moon_sep), moon_alt=_column(moon_alt),
+                   almanac=_almanac_dict(almanac),
+                   errors=errors)
+
+
+@main.route('/api/text', methods=['GET', 'POST'])
+@cached_response
+def api_text():
+
+    # GET as well, so that a static image can be linked with <img src=...>
+    equinox = request.values.get('equinox', '2000.0')
+    target = request.values.get('target', '').strip()
+    if not target:
+        return _bad_request(['no targets'])
+
+    try:
+        targets = helper.text_dict(target=target, equinox=equinox, logger=app.logger)
+        return _grid_response(targets, helper.site(request.values.get('site')), request.values.get('date'))
+    except Exception as e:
+        app.logger.error(f'Error: api text. {e}')
+        return _bad_request([f'{e}'])
+
+@main.route('/api/csv', methods=['POST'])
+@cached_response
+def api_csv():
+
+    files = request.files.getlist("csv[]")
+    header = request.form.get("header")
+    radec = request.form.get("radec", "hms")
+
+    try:
+        targets = helper.read_csv(files, header, radec, app.logger)
+        return _grid_response(targets, helper.site(request.form.get('site')), request.form.get('date'))
+    except Exception as e:
+        app.logger.error(f'Error: api csv. {e}')
+        return _bad_request([f'{e}'])
+
+@main.route('/api/ope', methods=['POST'])
+@cached_response
+def api_ope():
+
+    files = request.files.getlist("ope[]")
+    upload_dir = current_app.config['APP_UPLOAD']
+
+    try:
+        targets = helper.read_ope_uploads(files, upload_dir, app.logger)
+        return _grid_response(targets, helper.site(request.form.get('site')), request.form.get('date'))
+    except Exception as e:
+        app.logger.error(f'Error: api ope. {e}')
+        return _bad_request([f'{e}'])
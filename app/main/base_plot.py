@@ -20,12 +20,52 @@ from bokeh.models import Toggle, CustomJS
 from bokeh.layouts import layout, row, column
 from bokeh.models.widgets import CheckboxGroup
 from bokeh.models import Span
+from bokeh.util.serialization import convert_datetime_type
 
 from qplan import entity, common
 #from qplan.util.site import get_site
-from qplan.util.calcpos import load, ssbodies, alt2airmass
+from qplan.util.calcpos import alt2airmass
 from ginga.misc import Bunch
 
+try:
+    from .almanac import get_almanac, obsdate_noon
+except:
+    from almanac import get_almanac, obsdate_noon
+
+# altitude positions of the airmass axis ticks, and the airmass shown there
+AIRMASS_ALT_TICKS = [90, 80, 70, 60, 50, 40, 30, 20, 10]
+AIRMASS_LABELS = {alt: f"{alt2airmass(alt):.2f}" for alt in AIRMASS_ALT_TICKS}
+
+# altitudes outside of ALT_LOW-ALT_HIGH are shaded as poor visibility
+ALT_LOW = 30
+ALT_HIGH = 75
+
+# dash pattern drawn by hand under WebGL, as fractions of the plot size
+DASH_ON = 0.012
+DASH_OFF = 0.008
+
+
+def dash_segments(x, y, x_span, y_span, on=DASH_ON, off=DASH_OFF):
+    """
+    Cut the polyline (x, y) into dashes `on` long with gaps `off` long,
+    measured along the line in fractions of the plot's `x_span` and
+    `y_span`.  x may be datetimes.  Returns (xs, ys) for multi_line.
+    """
+    x = np.array([convert_datetime_type(v) if isinstance(v, datetime) else v for v in x], dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # distance along the line in plot fractions
+    dist = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x) / x_span, np.diff(y) / y_span))))
+
+    xs, ys = [], []
+    for start in np.arange(0.0, dist[-1], on + off):
+        end = min(start + on, dist[-1])
+        s = np.concatenate(([start], dist[(dist > start) & (dist < end)], [end]))
+        xs.append(np.interp(s, dist, x))
+        ys.append(np.interp(s, dist, y))
+    return (xs, ys)
+
+
 
 class BasePlot:
     def __init__(self, logger=None, **fig_args):
@@ -34,36 +74,41 @@ class BasePlot:
         self.cur_tz = tz.gettz('HST')
         self.y_min = 0
         self.y_max = 90
-        self.logger.debug(f"Initializing BasePlot with args: {fig_args}")
+        self.logger.debug("Initializing BasePlot with args: %s", fig_args)
         self.fig = figure(**fig_args)
 
-    def plot_base(self, site):
-        """Sets up the basic plot background: axes, sunset/sunrise, twilight bands, etc."""
-        local_timezone = site.tz_local
-        date_str = site.date.strftime("%Y-%m-%d")
+    def plot_base(self, ctx, almanac=None):
+        """Sets up the basic plot background: axes, sunset/sunrise, twilight bands, etc.
+        `almanac` may be passed in when several plots share the same night."""
+        local_timezone = ctx.tz
+        date_str = ctx.date.strftime("%Y-%m-%d")
 
-        self.logger.debug(f"Plotting base for {date_str} with timezone {local_timezone}")
+        self.logger.debug("Plotting base for %s with timezone %s", date_str, local_timezone)
         self.fig.title.text = f"Visibility for the night of {date_str}"
 
-        sunset, sunrise = self._sunset_sunrise(site)
+        # everything drawn below depends only on the site and the night
+        if almanac is None:
+            almanac = get_almanac(ctx.site, self._get_obsdate_noon(ctx), self.logger)
+
+        sunset, sunrise = almanac.sunset, almanac.sunrise
         self._set_axes_ranges(sunset, sunrise)
         self._set_axes_labels()
 
         # Drawing overlays
-        self.logger.debug(f"drawing sunset/sunrise..")
+        self.logger.debug("drawing sunset/sunrise..")
         self._draw_sunset_sunrise(sunset, sunrise)
-        self.logger.debug(f"drawing altitude..")
+        self.logger.debug("drawing altitude..")
         self._draw_altitude_bands()
-        self.logger.debug(f"drawing twilight..")
-        self._draw_twilight(site, sunset, sunrise)
-        self.logger.debug(f"drawing middle night..")
+        self.logger.debug("drawing twilight..")
+        self._draw_twilight(almanac)
+        self.logger.debug("drawing middle night..")
         self._draw_middle_night(sunset, sunrise)
-        self.logger.debug(f"drawing airmass..")
+        self.logger.debug("drawing airmass..")
         self._draw_airmass_axis()
-        self.logger.debug(f"drawing moon anno... site type={type(site)}")
-        self._draw_moon_annotation(site, sunrise, local_timezone)
+        self.logger.debug("drawing moon anno..")
+        self._draw_moon_annotation(almanac)
 
-        self.logger.debug(f"legend click policy..")
+        self.logger.debug("legend click policy..")
         self.fig.legend.click_policy = "hide"
         self.logger.debug("Base plot rendering complete.")
 
@@ -84,8 +129,8 @@ class BasePlot:
     # -----------------------
     def _draw_altitude_bands(self):
         """Highlights poor visibility regions."""
-        self.fig.add_layout(BoxAnnotation(bottom=75, fill_alpha=0.1, fill_color='yellow', line_color='yellow'))
-        self.fig.add_layout(BoxAnnotation(top=30, fill_alpha=0.1, fill_color='yellow', line_color='yellow'))
+        self.fig.add_layout(BoxAnnotation(bottom=ALT_HIGH, fill_alpha=0.1, fill_color='yellow', line_color='yellow'))
+        self.fig.add_layout(BoxAnnotation(top=ALT_LOW, fill_alpha=0.1, fill_color='yellow', line_color='yellow'))
 
     def _draw_airmass_axis(self):
         """Right-hand axis: airmass values corresponding to altitude scale."""
@@ -93,77 +138,45 @@ class BasePlot:
         self.fig.extra_y_ranges = {"Airmass": self.fig.y_range}
         axis = LinearAxis(y_range_name="Airmass", axis_label="Airmass")
 
-        # Choose some altitude positions for ticks
-        alt_ticks = [90, 80, 70, 60, 50, 40, 30, 20, 10]
-        am_vals   = [alt2airmass(a) for a in alt_ticks]
-
         # Place ticks at those altitude values, but show airmass numbers
-        axis.ticker = FixedTicker(ticks=alt_ticks)
-        axis.major_label_overrides = {alt: f"{am:.2f}" for alt, am in zip(alt_ticks, am_vals)}
+        axis.ticker = FixedTicker(ticks=AIRMASS_ALT_TICKS)
+        axis.major_label_overrides = dict(AIRMASS_LABELS)
 
         self.fig.add_layout(axis, 'right')
 
+    def _line(self, x, y, line_dash='solid', **kwargs):
+        """
+        fig.line, except that under WebGL, which does not draw dash
+        patterns, a dashed line is drawn as a multi_line of its dashes.
+        """
+        if line_dash == 'solid' or self.fig.output_backend != 'webgl':
+            return self.fig.line(x, y, line_dash=line_dash, **kwargs)
+
+        x_span = convert_datetime_type(self.fig.x_range.end) - convert_datetime_type(self.fig.x_range.start)
+        xs, ys = dash_segments(x, y, x_span, self.y_max - self.y_min)
+        return self.fig.multi_line(xs, ys, **kwargs)
+
     def _draw_middle_night(self, sunset, sunrise):
         """Draw dashed line at midnight."""
         middle = sunset + (sunrise - sunset) / 2
-        line = self.fig.line([middle, middle], [self.y_min, self.y_max],
-                             line_color='blue', line_width=2, line_dash='dashed')
+        line = self._line([middle, middle], [self.y_min, self.y_max],
+                          line_color='blue', line_width=2, line_dash='dashed')
 
         self._append_legend_item("Middle Night", [line])
 
-    def _draw_moon_annotation(self, site, sunrise, local_timezone):
+    def _draw_moon_annotation(self, almanac):
         """Display moon RA/Dec at midnight."""
+        text = f"Moon at Midnight\nRa: {almanac.moon_ra}\nDec: {almanac.moon_dec}"
+        self.logger.debug("text=%s", text)
 
-        self.logger.debug(f"site={site}")
-        today_midnight = datetime(
-            site.date.year,
-            site.date.month,
-            site.date.day,
-            0, 0, 0,
-            tzinfo=local_timezone)
-
-        midnight_local_timezone = today_midnight + timedelta(days=1)
-
-        self.logger.debug(f"midnight={midnight_local_timezone}, site={site.__dir__()}")
-
-        utc_dt = (midnight_local_timezone + timedelta(hours=10)).replace(tzinfo=timezone.utc)
-        ts  = load.timescale()
-        t   = ts.from_datetime(utc_dt)
-
-        moon = ssbodies['moon']
-
-        astrometric = site.location.at(t).observe(moon).apparent()
-        ra, dec, distance = astrometric.radec()
-
-        def format_hms(h, m, s):
-            return f"{int(h):02d}:{int(m):02d}:{s:04.1f}"
-
-        def format_dms(sign, d, m, s):
-            return f"{sign}{abs(int(d)):02d}:{int(m):02d}:{s:04.1f}"
-
-        h, m, s = ra.hms()
-        ra_str  = format_hms(h, m, s)
-
-        sign_num, d, mm, ss = dec.signed_dms()
-        sign = "+" if sign_num >= 0 else "-"
-        dec_str = format_dms(sign, d, mm, ss)
-
-        text = f"Moon at Midnight\nRa: {ra_str}\nDec: {dec_str}"
-        self.logger.debug(f"text={text}")
-
-        self.fig.text(x=[midnight_local_timezone], y=[0.5], text=[text], text_font_size="7pt",
+        self.fig.text(x=[almanac.midnight], y=[0.5], text=[text], text_font_size="7pt",
                       text_align="center", text_baseline="bottom")
 
-        self.logger.debug(f"done.......")
-
-    def _draw_twilight(self, site, sunset, sunrise):
+    def _draw_twilight(self, almanac):
         """Shade civil, nautical, and astronomical twilight bands."""
-        et6 = site.evening_twilight_6(sunset)
-        et12 = site.evening_twilight_12(sunset)
-        et18 = site.evening_twilight_18(sunset)
-        mt18 = site.morning_twilight_18(sunset)
-        mt12 = site.morning_twilight_12(sunset)
-        mt6 = site.morning_twilight_6(sunset)
+        sunset, sunrise = almanac.sunset, almanac.sunrise
+        et6, et12, et18 = almanac.et6, almanac.et12, almanac.et18
+        mt18, mt12, mt6 = almanac.mt18, almanac.mt12, almanac.mt6
 
         twilight_zones = [
             ("Civil Twilight", sunset, et6, mt6, sunrise, "orange", 0.4),
@@ -190,22 +203,11 @@ class BasePlot:
 
     def _draw_sunset_sunrise(self, sunset, sunrise):
         """Draw dashed line at sunset and sunrise."""
-        line1 = self.fig.line([sunset, sunset], [self.y_min, self.y_max], line_color='red', line_width=3, line_dash='dashed')
-        line2 = self.fig.line([sunrise, sunrise], [self.y_min, self.y_max], line_color='red', line_width=3, line_dash='dashed')
+        line1 = self._line([sunset, sunset], [self.y_min, self.y_max], line_color='red', line_width=3, line_dash='dashed')
+        line2 = self._line([sunrise, sunrise], [self.y_min, self.y_max], line_color='red', line_width=3, line_dash='dashed')
         label = f"Sunset/rise {sunset.strftime('%H:%M:%S')} {sunrise.strftime('%H:%M:%S')}"
         self._append_legend_item(label, [line1, line2])
 
-    def _sunset_sunrise(self, site):
-        """Return sunset and sunrise datetimes for the site/date."""
-        # noon on the observation date
-        noon = self._get_obsdate_noon(site)
-        prev_midnight = noon - timedelta(hours=12)
-
-        sunset = site.sunset(noon)
-        sunrise = site.sunrise(noon)
-        self.logger.debug(f"Sunset: {sunset}, Sunrise: {sunrise}")
-        return sunset, sunrise
-
     def _append_legend_item(self, label, renderers):
         """Add legend item safely (create if needed)."""
         if self.fig.legend:
@@ -216,25 +218,13 @@ class BasePlot:
 
         leg.items.append(LegendItem(label=label, renderers=renderers))
 
-    def _get_obsdate_noon(self, site):
+    def _get_obsdate_noon(self, ctx):
         """A mostly internal procedure to get the date/time at noon
         on the day of observation.
         NOTE: this is the noon of the DAY that observation begins at
         sunset. So, for example, at 3:00 (AM) it is noon on the day BEFORE
         """
-        dt = site.date.astimezone(self.cur_tz)
-
-        # noon and midnight on the current date
-        noon = dt.replace(hour=12, minute=0, second=0, microsecond=0)
-        prev_noon = noon - timedelta(hours=24)
-        prev_midnight = noon - timedelta(hours=12)
-        sunrise_today = site.sunrise(prev_midnight)
-
-        if dt < sunrise_today:
-            # it's not yet daytime on this date
-            noon = prev_noon
-
-        return noon
+        return obsdate_noon(ctx, self.cur_tz)
 
 
 if __name__ == '__main__':
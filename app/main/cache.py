@@ -0,0 +1,110 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread-safe mapping holding at most `maxsize` entries; the least
+    recently used entry is evicted first.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, entries=len(self._data))
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SizedLRUCache(LRUCache):
+    """
+    An LRUCache bounded by the total size of its values, as measured by
+    `sizeof(value)` in bytes, rather than by the number of entries.  If
+    `evictable(value)` is given, only the values for which it is True
+    are evicted, so the cache may stay over `maxbytes` until they are.
+    """
+    def __init__(self, maxbytes, sizeof, evictable=None):
+        super().__init__(maxsize=None)
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self._sizeof = sizeof
+        self._evictable = evictable
+        self._sizes = {}
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            self.nbytes -= self._sizes.pop(key, 0)
+            self._data.pop(key, None)
+            if size > self.maxbytes and (self._evictable is None or self._evictable(value)):
+                # would evict everything else and still not fit; the
+                # old value is dropped so that it is not served stale
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._sizes[key] = size
+            self.nbytes += size
+            self._evict()
+
+    def _evict(self):
+        if self._evictable is None:
+            while self.nbytes > self.maxbytes:
+                key, _ = self._data.popitem(last=False)
+                self.nbytes -= self._sizes.pop(key)
+            return
+
+        # least recently used first, skipping the values to keep
+        for key in list(self._data):
+            if self.nbytes <= self.maxbytes:
+                break
+            if self._evictable(self._data[key]):
+                del self._data[key]
+                self.nbytes -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(bytes=self.nbytes, maxbytes=self.maxbytes)
+        return stats
@@ -0,0 +1,22 @@
+from collections import namedtuple
+
+
+class ObservingContext(namedtuple('ObservingContext', ['site', 'date', 'tz'])):
+    """
+    Immutable description of what one request observes: the site, the
+    observing date/time and the local timezone.
+
+    The site object is shared between requests and threads, so it must
+    only be queried with explicit dates and never have its date set.
+    """
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.site.name
+
+
+def observing_context(site, mydate, mytime='17:00:00'):
+    """Make the context for observing from `site` on the night of `mydate`."""
+    date = site.get_date(f'{mydate} {mytime}')
+    return ObservingContext(site=site, date=date, tz=site.tz_local)
@@ -0,0 +1,64 @@
+import threading
+from datetime import datetime, timezone
+
+from qplan.util.calcpos import load, ssbodies
+
+# The skyfield objects every ephemeris computation needs, loaded once per
+# process instead of per request: the timescale (leap seconds and Delta
+# T tables), the planetary kernel and the sites' topocentric locations.
+#
+# The kernel is the one qplan loads.  skyfield reads it through
+# jplephem, which memory-maps the file; once a segment has been used,
+# its pages are shared through the page cache by every process that maps
+# the same file, and by workers forked after warmup() without copies.
+
+_lock = threading.Lock()
+_timescale = None
+_locations = {}
+_bodies = {}
+
+
+def timescale():
+    """The process-wide skyfield Timescale."""
+    global _timescale
+
+    if _timescale is None:
+        with _lock:
+            if _timescale is None:
+                _timescale = load.timescale()
+    return _timescale
+
+def kernel():
+    """The planetary kernel (a skyfield SpiceKernel), e.g. kernel()['moon']."""
+    return ssbodies
+
+def body(name):
+    """A body of the kernel, e.g. 'moon', looked up once."""
+    res = _bodies.get(name)
+    if res is None:
+        res = _bodies.setdefault(name, ssbodies[name])
+    return res
+
+def location(site):
+    """The skyfield position of `site` (the earth plus its topos), cached by site name."""
+    loc = _locations.get(site.name)
+    if loc is None:
+        loc = _locations.setdefault(site.name, site.location)
+    return loc
+
+def observer(site, dts):
+    """`site` at the datetimes `dts`, ready to observe() bodies from."""
+    return location(site).at(timescale().from_datetimes(dts))
+
+def load_all(site, logger=None):
+    """
+    Load the timescale and map the kernel segments used for `site` by
+    computing the sun and the moon from it once.  Called from warmup.
+    """
+    t = timescale().from_datetime(datetime.now(timezone.utc))
+    here = location(site).at(t)
+    for name in ('sun', 'moon'):
+        here.observe(body(name)).apparent().altaz()
+
+    if logger is not None:
+        logger.debug('ephemeris loaded. kernel=%s', kernel())
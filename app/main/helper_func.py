@@ -1,25 +1,32 @@
 import os
 import re
-import datetime
-import csv
-import pandas as pd
+import tempfile
+import numpy as np
 
 from bokeh.layouts import layout, row, column
-from bokeh.models.layouts import Row, Column
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 
 from astropy.coordinates import SkyCoord, Angle
 import astropy.units as u
 
-from qplan.common import moon
 from qplan.util.site import site_subaru as subaru
-from qplan.entity import StaticTarget
 from ginga.misc import Bunch
+from werkzeug.utils import secure_filename
 
 from .target_plot import TargetPlot
-from .laser_plot import LaserPlot
-
-from oscript.parse.ope import get_vars_ope, get_coords2
+from .nights_plot import NightsPlot
+from .base_plot import ALT_LOW
+from . import trajectory
+from . import nights
+from . import observability
+from . import sampling
+from . import metrics
+from .logutil import summary
+from .context import observing_context
+from .almanac import night_almanac
+
+# pandas (csv and laser files), oscript (ope files) and LaserPlot are
+# imported by the functions that use them, so that a worker only loads
+# what its requests need; see warmup.py to load them up front.
 
 # soss pattern. match a sequence with at least 6 consecutive digits; '+', '-', and decimal point are optional.
 soss_pattern = r'^(?<![+-])[+-]?\d{6,}(?:\.\d+)?'  #r'(?<![+-])[+-]?\b\d{6}\b(?:\.\d+)?'
@@ -39,6 +46,15 @@ ra_prog2 = re.compile(ra_pattern2)
 dec_pattern2 = r"^[+-]?(?:[0-8][0-9]:[0-5][0-9]:[0-5][0-9](?:\.\d+)?|90:00:00(?:\.0+)?)$"
 dec_prog2 = re.compile(dec_pattern2)
 
+# laser safe window hh:mm:ss-hh:mm:ss; hours may run past 24
+laser_window_pattern = r"^(\d{1,2}):(\d{2}):(\d{2})-(\d{1,2}):(\d{2}):(\d{2})$"
+
+# the laser clearinghouse predictions are in Hawaii local time
+LASER_TZ = 'US/Hawaii'
+
+# ope *LOAD directive, which needs the loaded file in the include dir
+load_prog = re.compile(r'^\s*\*load\b', re.IGNORECASE | re.MULTILINE)
+
 
 class TargetError(Exception):
     pass
@@ -60,60 +76,107 @@ def dec_to_dms(dec_deg, sep=':', precision=2):
     dms = angle.to_string(unit=u.deg, sep=sep, precision=precision, alwayssign=True, pad=True)
     return str(dms)
 
-def fix_time(year, month, day, hour, min, sec, logger):
+def upload_name(src):
+    """Name of an uploaded file (werkzeug FileStorage), stream or path, for messages."""
+    return getattr(src, 'filename', None) or getattr(src, 'name', None) or str(src)
+
+def read_lines(src):
+    """
+    Return the lines of `src` as bytes; `src` may be a list of lines, a
+    bytes/str buffer or a binary stream such as an uploaded file.
+    """
+    if isinstance(src, list):
+        return src
+    if hasattr(src, 'read'):
+        src = src.read()
+    if isinstance(src, str):
+        src = src.encode('utf-8')
+    return src.splitlines()
+
+def read_text(src):
+    """Return the text of a path, a bytes/str buffer or a stream."""
+    if isinstance(src, (bytes, bytearray)):
+        return src.decode('utf-8')
+    if hasattr(src, 'read'):
+        buf = src.read()
+        return buf.decode('utf-8') if isinstance(buf, bytes) else buf
+    if isinstance(src, str) and os.path.exists(src):
+        with open(src, "r") as in_f:
+            return in_f.read()
+    return src
+
+def iter_lines(src):
+    """
+    Iterate over the lines of `src` (see read_lines) as text; streams
+    are read line by line instead of all at once.
+    """
+    if isinstance(src, (bytes, bytearray, str)):
+        src = read_lines(src)
+    for line in src:
+        yield line.decode('utf-8') if isinstance(line, bytes) else line
+
+def parse_laser_windows(obs_date, windows, tz=LASER_TZ):
+    """
+    Convert 'hh:mm:ss-hh:mm:ss' safe windows on `obs_date` to tz-aware
+    start and end times.  Hours of 24 and more fall on the next day.
+    """
+    import pandas as pd
 
-    aday = 24 # hours
+    hms = pd.Series(windows, dtype=object).str.extract(laser_window_pattern)
+    bad = hms.isna().any(axis=1).to_numpy()
+    if bad.any():
+        raise TargetError(f"Invalid safe window. {windows[np.argmax(bad)]}, format: hh:mm:ss-hh:mm:ss")
 
-    dif = hour - aday
-    if dif >= 0:
-        logger.debug(f"hour {hour} >= 24")
-        t = datetime.datetime(year, month, day, dif, min, sec)
-        t += datetime.timedelta(days=1) # next day
-    else:
-        t = datetime.datetime(year, month, day, hour, min, sec)
+    hms = hms.astype(np.int64).to_numpy()
+    secs = hms[:, [0, 3]] * 3600 + hms[:, [1, 4]] * 60 + hms[:, [2, 5]]
+    times = np.datetime64(obs_date, 's') + secs.astype('timedelta64[s]')
 
-    logger.debug(f"fixed time. {t}")
-    return t
+    start = pd.DatetimeIndex(times[:, 0]).tz_localize(tz)
+    end = pd.DatetimeIndex(times[:, 1]).tz_localize(tz)
+    return (start, end)
 
 def get_laser_info(data, logger):
+    """
+    Parse a laser clearinghouse predictions file: the observing date on
+    the first line, then one target per line with ra/dec in degrees
+    followed by its safe windows.  Coordinates and window times of all
+    targets are converted in one pass.
 
+    Each target's safe_time is a Bunch of tz-aware start/end times.
+    """
     logger.debug('get laser info...')
 
-    targets = []
-
-    laser_info = {}
+    lines = iter_lines(data)
+    obs_date = next(lines).strip()
 
-    obs_date = data[0]
-    data.remove(obs_date)
-    obs_date = obs_date.decode('utf-8').strip()
-    year, month, day = (int(ob) for ob in obs_date.split('-'))
+    names, ras, decs = [], [], []
+    windows = []
+    bounds = [0]
 
-    for d in data:
-        logger.debug(f'data={d}')
-        d = d.decode("utf-8").strip().split()
-        logger.debug(f'd strip,split={d}')
+    for line in lines:
+        d = line.split()
         if not d:
             continue
-        name = d[0]
-        c = SkyCoord(ra=float(d[1])*u.degree, dec=float(d[2])*u.degree)
-        ra = c.ra.to_string(unit=u.hourangle, precision=3, sep=':', pad=True)
-        dec = c.dec.to_string(sep=':', precision=2, alwayssign=True, pad=True)
-        equinox = 2000.0
-        safe_time = []
-        for t in d[3:]:
-            t = t.split('-')
-            st = t[0] # start time
-            et = t[1] # end time
-            # hr, min, sec
-            sh, sm, ss = (int(s) for s in st.split(':'))
-            eh, em, es = (int(e) for e in et.split(':'))
-            start_time = fix_time(year, month, day, sh, sm, ss, logger)
-            end_time = fix_time(year, month, day, eh, em, es, logger)
-            safe_time.append((start_time, end_time))
-        targets.append(Bunch.Bunch(name=name, ra=ra, dec=dec, equinox=equinox, safe_time=safe_time))
-
-    logger.debug(f'obs_date={obs_date}')
-    logger.debug(f'targets={targets}')
+        names.append(d[0])
+        ras.append(d[1])
+        decs.append(d[2])
+        windows.extend(d[3:])
+        bounds.append(len(windows))
+
+    logger.debug('obs_date=%s, targets=%s, windows=%s', obs_date, len(names), len(windows))
+
+    c = SkyCoord(ra=np.asarray(ras, dtype=float)*u.degree, dec=np.asarray(decs, dtype=float)*u.degree)
+    ras = np.atleast_1d(c.ra.to_string(unit=u.hourangle, precision=3, sep=':', pad=True))
+    decs = np.atleast_1d(c.dec.to_string(sep=':', precision=2, alwayssign=True, pad=True))
+
+    start, end = parse_laser_windows(obs_date, windows)
+
+    targets = []
+    equinox = 2000.0
+    for i, name in enumerate(names):
+        s = slice(bounds[i], bounds[i+1])
+        safe_time = Bunch.Bunch(start=start[s], end=end[s])
+        targets.append(Bunch.Bunch(name=name, ra=str(ras[i]), dec=str(decs[i]), equinox=equinox, safe_time=safe_time))
 
     return (obs_date, targets)
 
@@ -166,129 +229,236 @@ def equinox_format(equinox):
     return float("{:.1f}".format(equinox))
 
 def csv_with_header(csv_file, logger):
+    import pandas as pd
 
     try:
-        df = pd.read_csv(csv_file)
+        df = pd.read_csv(getattr(csv_file, 'stream', csv_file))
         cols = {}
         for col in df.columns:
-            logger.debug(f'col=<{col}>, col strip lowercase =<{col.lower().strip()}>')
             cols[col] = col.lower().strip()
-        logger.debug(f'cols={cols}')
+        logger.debug('cols=%s', cols)
         df = df.rename(columns=cols)
     except Exception as e:
         logger.error(f'error: loading csv into pandas. {e}')
         raise TargetError(f'{e}')
-    logger.debug(f'df={df}')
+    logger.debug('df=%s', summary(df))
 
     #for row in df.itertuples():
-    #    logger.debug(f'row={row}')
+    #    logger.debug('row=%s', row)
 
 
     return df
 
 def csv_without_header(csv_file, logger):
+    import pandas as pd
 
     try:
-        df = pd.read_csv(csv_file, usecols=[0,1,2, 3], names=['name', 'ra', 'dec', 'equinox'], header=None)
+        df = pd.read_csv(getattr(csv_file, 'stream', csv_file), usecols=[0,1,2, 3], names=['name', 'ra', 'dec', 'equinox'], header=None)
     except Exception as e:
         logger.error(f'error: loading csv into pandas. {e}')
         raise TargetError(f'{e}')
 
     return df
 
-def ra_float_to_string(val, logger):
+def ra_float_to_string(values):
+    """Format a column of hhmmss.sss numbers as zero padded strings, NaN as ''."""
+    sign = np.where(values < 0, '-', '')
+    return (sign + values.abs().map('{:010.3f}'.format)).where(values.notna(), '')
 
-    logger.debug(f'ra={val}')
+def dec_float_to_string(values):
+    """Format a column of ddmmss.ss numbers as zero padded strings, NaN as ''."""
+    sign = np.where(values < 0, '-', '')
+    return (sign + values.abs().map('{:09.2f}'.format)).where(values.notna(), '')
 
-    leading_zero = 10
-    if val < 0.0:
-        leading_zero = 11
+def deg_to_sexagesimal(values, hours=False, precision=2, alwayssign=False):
+    """
+    Convert an array of degrees to 'ddmmss.ss' strings (or 'hhmmss.ss'
+    if `hours` is True); the column-wise counterpart of ra_to_hms and
+    dec_to_dms with sep=''.  NaN values come out as 'nan'.
+    """
+    values = np.asarray(values, dtype=float)
+    scale = 3600.0 / 15.0 if hours else 3600.0
+    sec = np.round(np.abs(values) * scale, precision)
+    d, rem = np.divmod(sec, 3600.0)
+    m, sec = np.divmod(rem, 60.0)
+    width = 3 + precision if precision else 2
+    signs = np.where(values < 0, '-', '+' if alwayssign else '')
+
+    return [f'{sign}{int(dd):02d}{int(mm):02d}{ss:0{width}.{precision}f}' if not np.isnan(val) else 'nan'
+            for val, sign, dd, mm, ss in zip(values, signs, d, m, sec)]
+
+def _append_error(err, bad, msg):
+    """Append `msg` to the error column `err` where `bad` is True."""
+    sep = np.where(err == '', '', ', ')
+    return err.where(~bad, err + sep + msg)
+
+def _csv_columns(df, radec_unit):
+    """Return the name, ra, dec and equinox columns of `df` as strings/floats."""
+    import pandas as pd
+
+    missing = [col for col in ['name', 'ra', 'dec', 'equinox'] if col not in df.columns]
+    if missing:
+        raise TargetError(f"missing column(s): {', '.join(missing)}")
+
+    name = df['name'].fillna('').astype(str).str.strip()
+    equinox = pd.to_numeric(df['equinox'], errors='coerce')
+
+    if radec_unit.upper() == 'DEG':
+        ra = deg_to_sexagesimal(pd.to_numeric(df['ra'], errors='coerce'), hours=True)
+        dec = deg_to_sexagesimal(pd.to_numeric(df['dec'], errors='coerce'), alwayssign=True)
+        ra = pd.Series(ra, index=df.index)
+        dec = pd.Series(dec, index=df.index)
+    else: # radec_unit is HOUR
+        ra, dec = df['ra'], df['dec']
+        # hhmmss.sss / ddmmss.ss written as plain numbers
+        if pd.api.types.is_numeric_dtype(ra):
+            ra = ra_float_to_string(ra)
+        if pd.api.types.is_numeric_dtype(dec):
+            dec = dec_float_to_string(dec)
+        ra = ra.fillna('').astype(str).str.strip()
+        dec = dec.fillna('').astype(str).str.strip()
+
+    return name, ra, dec, equinox
+
+def validate_csv_frame(df, radec_unit, logger):
+    """
+    Validate and normalize the name/ra/dec/equinox columns of a csv
+    DataFrame column by column.  Returns (targets, errors): DataFrames of
+    the valid rows, with ra/dec as 'hh:mm:ss.s'/'dd:mm:ss.s', and of the
+    invalid rows with an 'err' column describing what is wrong.
+    """
+    import pandas as pd
 
-    ra = f'{val:0{leading_zero}.3f}'
-    logger.debug(f'ra to string={ra}')
-    return ra
+    name, ra, dec, equinox = _csv_columns(df, radec_unit)
+    raw_ra = df['ra'].fillna('').astype(str).str.strip()
+    raw_dec = df['dec'].fillna('').astype(str).str.strip()
 
-def dec_float_to_string(val, logger):
+    ra1 = ra.str.match(ra_pattern1)
+    ra = ra.where(~ra1, ra.str.replace(r'^(\d\d)(\d\d)', r'\1:\2:', regex=True))
+    ra_ok = ra1 | ra.str.match(ra_pattern2)
 
-    logger.debug(f'dec={val}')
+    dec1 = dec.str.match(dec_pattern1)
+    dec = dec.where(~dec1, dec.str.replace(r'^([+-]?\d\d)(\d\d)', r'\1:\2:', regex=True))
+    dec_ok = dec1 | dec.str.match(dec_pattern2)
 
-    leading_zero = 9
-    if val < 0.0:
-        leading_zero = 10
+    err = pd.Series('', index=df.index, dtype=str)
+    err = _append_error(err, ~ra_ok, "Ra invalid value or format.  ra=" + raw_ra + ", format: hhmmss.s*")
+    err = _append_error(err, ~dec_ok, "Dec invalid value or format.  dec=" + raw_dec + ", format: ddmmss.s*")
+    err = _append_error(err, name == '', "No name")
+    err = _append_error(err, equinox.isna(), "Equinox invalid value")
 
-    dec = f'{val:0{leading_zero}.2f}'
-    logger.debug(f'dec to string={dec}')
-    return dec
+    table = pd.DataFrame(dict(name=name, ra=ra, dec=dec, equinox=equinox, err=err))
+    table['coord'] = table['ra'] + ' ' + table['dec']
+    bad = err != ''
 
-def read_csv(csvs, header, radec_unit,  logger):
-    targets = []
+    errors = table[bad].copy()
+    errors['coord'] = raw_ra[bad] + ' ' + raw_dec[bad]
+
+    logger.debug('csv rows=%s, invalid=%s', len(table), int(bad.sum()))
+    return table[~bad].copy(), errors
+
+def read_csv_table(csvs, header, radec_unit, logger):
+    """
+    Read and validate csv file(s).  Returns a DataFrame of all the rows,
+    in file order, as validate_csv_frame makes them (with an empty 'err'
+    for the valid ones) and with a 'file' and a 'row' column added.
+    """
+    import pandas as pd
+
+    tables = []
 
     for csv_file in csvs:
-        logger.debug(f'csv file={csv_file}')
+        logger.debug('csv file=%s', upload_name(csv_file))
         if header is not None:
             df = csv_with_header(csv_file, logger)
         else:
             df = csv_without_header(csv_file, logger)
 
-        for row in df.itertuples():
-            logger.debug(f'row={row}')
+        table = pd.concat(validate_csv_frame(df, radec_unit, logger)).sort_index()
+        table.insert(0, 'row', table.index + 1)
+        table.insert(0, 'file', upload_name(csv_file))
+        tables.append(table)
 
-            try:
-                name = row.name.strip()
-                logger.debug(f'ra={row.ra}, ra type={type(row.ra)}, dec={row.dec}, dec type={type(row.dec)}')
-                if radec_unit.upper() == 'DEG':
-                    ra = ra_to_hms(float(row.ra), sep='')
-                    dec = dec_to_dms(float(row.dec), sep='')
-                    logger.debug(f'radec in Degree.  ra={ra}, dec={dec}')
-                else: # radec_unit is HOUR
-                    if isinstance(row.ra, float):
-                        ra = ra_float_to_string(row.ra, logger)
-                    else:
-                        ra = row.ra.strip()
-                    if isinstance(row.dec, float):
-                        dec = dec_float_to_string(row.dec, logger)
-                    else:
-                        dec = row.dec.strip()
-
-                logger.debug(f'name={name}, ra={ra}, dec={dec}, equinox={row.equinox}')
-                res = _validate_target(name, ra, dec, row.equinox, logger)
-                targets.append(res)
-            except Exception as e:
-                logger.error(f'Error: reading csv file(s). {e}')
-                targets.append(Bunch.Bunch(name=name, ra=row.ra, dec=row.dec, coord=f'{ra} {dec}', equinox=row.equinox, err=e))
+    if not tables:
+        return pd.DataFrame(columns=['file', 'row', 'name', 'ra', 'dec', 'equinox', 'err', 'coord'])
 
-    logger.debug(f'targets={targets}')
+    return pd.concat(tables, ignore_index=True)
+
+def read_csv(csvs, header, radec_unit,  logger):
+
+    table = read_csv_table(csvs, header, radec_unit, logger)
+
+    targets = [Bunch.Bunch(name=t.name, ra=t.ra, dec=t.dec, coord=t.coord, equinox=float(t.equinox), err=t.err)
+               for t in table.itertuples(index=False)]
+
+    logger.debug('csv targets=%s, errors=%s', len(table), int((table['err'] != '').sum()))
     return targets
 
 def ope(opes, include_dir, logger):
+    """
+    Read the targets of ope files.  Each entry of `opes` is a path, an
+    uploaded file/stream or a (name, text) pair; `include_dir` is only
+    needed if an ope *LOADs other files.
+    """
+    from oscript.parse.ope import get_vars_ope, get_coords2
 
     targets = []
 
+    include_dirs = [include_dir,] if include_dir else []
+
     try:
         for ope in opes:
-            with open(ope, "r") as in_f:
-                buf = in_f.read()
-                d = get_vars_ope(buf, [include_dir,])
-                target = d.varDict
-
-                for name, line in target.items():
-                    logger.debug(f'name={name}, line={line}, linetype={type(line)}')
-                    coords = get_coords2(line)
-                    logger.debug(f'ope target name={name}, coords={coords}, type={type(coords)}')
-                    if coords is not None:
-                        logger.debug(f'ra={coords.ra}, dec={coords.dec}, equinox={coords.equinox}')
-                        res = _validate_target(name, coords.ra, coords.dec, coords.equinox, logger)
-                        targets.append(res)
+            if isinstance(ope, tuple):
+                ope, buf = ope
+            else:
+                buf = read_text(ope)
+            d = get_vars_ope(buf, include_dirs)
+            target = d.varDict
+
+            for name, line in target.items():
+                coords = get_coords2(line)
+                if coords is not None:
+                    res = _validate_target(name, coords.ra, coords.dec, coords.equinox, logger)
+                    targets.append(res)
     except Exception as e:
         logger.error(f'Error: opening an ope file. {e}')
-        raise TargetError(f'open/read ope file. ope={ope}, {e}')
+        raise TargetError(f'open/read ope file. ope={upload_name(ope)}, {e}')
 
-    logger.debug(f'ope targets={targets}')
+    logger.debug('ope targets=%s', summary(targets))
     return targets
 
+def ope_needs_include(buf):
+    """True if the ope text *LOADs another file (e.g. a .prm)."""
+    return load_prog.search(buf) is not None
+
+def read_ope_uploads(files, upload_dir, logger):
+    """
+    Read the targets of uploaded ope files in memory.  Only if one of
+    them *LOADs another file are the other uploads (e.g. .prm files)
+    written to disk, in a private temporary include directory under
+    `upload_dir` that is removed afterwards.
+    """
+    opes = []
+    others = []
+    for f in files:
+        filename = secure_filename(f.filename)
+        if filename.lower().endswith(".ope"):
+            opes.append((filename, read_text(f.stream)))
+        else:
+            others.append((filename, f))
+
+    if not any(ope_needs_include(buf) for _, buf in opes):
+        return ope(opes, None, logger)
+
+    with tempfile.TemporaryDirectory(dir=upload_dir) as include_dir:
+        logger.debug('ope include dir=%s', include_dir)
+        for filename, f in others:
+            f.save(os.path.join(include_dir, filename))
+        return ope(opes, include_dir, logger)
+
 def _validate_target(name, ra, dec, equinox, logger):
 
-    logger.debug(f'validate name={name}, ra={ra}, dec={dec}, equinox={equinox}')
+    logger.debug('validate name=%s, ra=%s, dec=%s, equinox=%s', name, ra, dec, equinox)
 
     ra, ra_valid = validate_ra(ra)
     dec, dec_valid = validate_dec(dec)
@@ -304,15 +474,15 @@ def validate_ra_dec_format(name, coord, equinox, logger, unit=''):
     name, name_error = validate_name(name)
     try:
         if unit.lower() == "degree":
-            logger.debug(f'coord deg={coord}')
+            logger.debug('coord deg=%s', coord)
             c = SkyCoord(coord, unit=(u.deg, u.deg))
         elif unit.lower() == 'hourangle':
-            logger.debug(f'coord hourangle={coord}')
+            logger.debug('coord hourangle=%s', coord)
             c = SkyCoord(coord, unit=(u.hourangle, u.deg))
 
         ra = ra_to_hms(c.ra.deg)
         dec = dec_to_dms(c.dec.deg)
-        logger.debug(f"ra_hms={ra}, dec_dms={dec}")
+        logger.debug("ra_hms=%s, dec_dms=%s", ra, dec)
 
         coord_error = None
     except Exception as e:
@@ -320,32 +490,32 @@ def validate_ra_dec_format(name, coord, equinox, logger, unit=''):
         coord_error = f'{e}'
 
     errs = [err for err in [name_error, coord_error] if err]
-    logger.debug(f'errs={errs}')
+    logger.debug('errs=%s', errs)
 
     errs = ', '.join(errs)
 
     if not errs:
         ra_dec = Bunch.Bunch(name=name, ra=ra, dec=dec, coord=f'{ra} {dec}', equinox=equinox, err=errs)
-        logger.debug(f'deg to hms/dms. {ra_dec}')
+        logger.debug('deg to hms/dms. %s', ra_dec)
     else:
         ra_dec = Bunch.Bunch(name=name, ra=None, dec=None, coord=coord, equinox=equinox, err=errs)
     return ra_dec
 
 def verify_coord_format(name, coord, equinox, logger):
 
-    logger.debug(f'coord=<{coord}>, type{type(coord)}')
+    logger.debug('coord=<%s>, type%s', coord, type(coord))
     # Pattern matching to detect SOSS-format coordinates is much
     # easier if the "coord" string is split into separate ra/dec values.
     coords = coord.split()
     ra = coords[0].strip()
     dec = coords[1].strip()
     if (ra_match := re.match(soss_pattern, ra)) and (dec_match := re.match(soss_pattern, dec)):
-        logger.debug(f'soss pattern {ra_match=} {dec_match=}')
+        logger.debug('soss pattern ra_match=%s dec_match=%s', ra_match, dec_match)
         res = _validate_target(name, ra, dec, equinox, logger)
         return res
 
     matches = re.findall(deg_pattern, coord)
-    logger.debug(f'degree pattern={matches}')
+    logger.debug('degree pattern=%s', matches)
     if len(matches) == 2:
         return validate_ra_dec_format(name, coord, equinox, logger, unit='degree')
     else:
@@ -356,14 +526,12 @@ def text_dict(target, equinox, logger):
     targets = []
     target_list = target.split("\r\n")
 
-    logger.debug(f'text target_list={target_list}')
+    logger.debug('text target_list=%s', summary(target_list))
 
     for t in target_list:
-        logger.debug(f'target={t}')
         name = t.split()[0]
         idx = t.find(' ')
         coord = t[idx:].strip()
-        logger.debug(f'name={name}, coord={coord}')
         res = verify_coord_format(name, coord, equinox, logger)
         targets.append(res)
 
@@ -374,81 +542,167 @@ def site(mysite):
     site_dict = {"subaru": subaru}
     return site_dict.get(mysite)
 
-def populate_interactive_target(target_list, mysite, mydate, logger):
+def compute_targets(target_list, ctx, logger, time_interval=None):
+    """
+    Separate the valid targets from the invalid ones and compute the
+    trajectories of the valid ones every `time_interval` minutes (the
+    configured default if empty).  Returns (valid, batch, errors);
+    batch is None if there are no valid targets.
+    """
+    time_interval = sampling.time_interval(time_interval)
+    errors = []
+
+    valid = []
+
+    for t in target_list:
+        if not t.err:
+            valid.append(t)
+        else:
+            errors.append(f'name={t.name}, coord={t.coord}, equinox={t.equinox}. err={t.err}')
+
+    if not valid:
+        return (valid, None, errors)
+
+    # all targets share the night's time grid; compute them in one pass
+    batch = trajectory.cached_trajectories(ctx, valid, time_interval=time_interval, logger=logger)
+
+    return (valid, batch, errors)
+
+def target_data(valid, batch):
+    """Per-target Bunches of tgt_calc and tgt_info, as the plot classes take them."""
+    targets = []
+    for i, t in enumerate(valid):
+        tgt_info = Bunch.Bunch(name=t.name, ra=t.ra, dec=t.dec)
+        targets.append(Bunch.Bunch(tgt_calc=batch.target_calc(i), tgt_info=tgt_info))
+    return targets
 
+def populate_interactive_target(target_list, mysite, mydate, logger, time_interval=None, progress=None):
+    """
+    Build the visibility plot of `target_list`.  `progress`, if given, is
+    called with a message as each stage starts.
+    """
     logger.debug('poplulate interactive target...')
 
     title = f"Visibility for the night of {mydate}"
-    mydate_time = f'{mydate} 17:00:00'
-    mysite.set_date(mysite.get_date(mydate_time))
-    timezone = mysite.tz_local
+    ctx = observing_context(mysite, mydate)
 
     TOOLS = "pan,wheel_zoom,box_zoom,reset,save"
     toolbar_location = 'above'
     plot_height = 1230
     plot_width = 1580
-    # note: output_backend: webgl is to optimize drawings, but can't draw dotted line
+    # note: TargetPlot switches to the webgl output_backend for long target lists
     fig_args = {"x_axis_type": "datetime",  "title": title, "tools": TOOLS, "toolbar_location": toolbar_location, "height": plot_height, "width": plot_width,} #  "output_backend": "webgl"}
 
     plot = TargetPlot(logger, **fig_args)
 
-    errors = []
+    if progress is not None:
+        progress(f'computing trajectories of {len(target_list)} targets')
+    with metrics.stage('ephemeris'):
+        valid, batch, errors = compute_targets(target_list, ctx, logger, time_interval)
 
-    targets = []
+    if not valid:
+        return (plot.fig, errors)
 
-    for t in target_list:
-        if not t.err:
-            logger.debug(f'ra={t.ra},  dec={t.dec}')
-            tgt = StaticTarget(name=t.name, ra=t.ra, dec=t.dec, equinox=t.equinox)
-            tgt_info = Bunch.Bunch(name=t.name, ra=t.ra, dec=t.dec)
-            tgt_calc = mysite.get_target_info(tgt)
-            targets.append(Bunch.Bunch(tgt_calc=tgt_calc, tgt_info=tgt_info))
-        else:
-            errors.append(f'name={t.name}, coord={t.coord}, equinox={t.equinox}. err={t.err}')
-    logger.debug(f'target list={targets}')
+    targets = target_data(valid, batch)
+    logger.debug('target list=%s', len(targets))
 
-    if not targets:
-        return (plot.fig, errors)
+    if progress is not None:
+        progress(f'plotting {len(targets)} targets')
 
     try:
-        plot.plot_target(mysite, targets)
+        with metrics.stage('bokeh_models'):
+            plot.plot_target(ctx, targets)
     except Exception as e:
         logger.error(f'error: plotting targets. {e}')
         errors.append(f"plotting target(s). {e}")
 
+    if plot.toggles:
+        return (row(plot.fig, column(plot.toggles)), errors)
+
+    return (plot.fig, errors)
+
+def target_summary(target_list, mysite, mydate, logger, time_interval=None):
+    """
+    The observability table of `target_list` for the night of `mydate`,
+    computed from the trajectories without building a plot.  Returns
+    (rows, errors); see observability.table_rows.
+    """
+    ctx = observing_context(mysite, mydate)
+
+    with metrics.stage('ephemeris'):
+        valid, batch, errors = compute_targets(target_list, ctx, logger, time_interval)
+        almanac = night_almanac(ctx, logger)
+
+    if not valid:
+        return ([], errors)
+
+    with metrics.stage('summary'):
+        rows = observability.table_rows(valid, observability.summarize(batch, almanac), ctx.tz)
+
+    return (rows, errors)
+
+def populate_interactive_nights(target_list, mysite, date_start, date_end, logger, progress=None):
+    """
+    Build the heatmap of nightly visibility of `target_list` for every
+    night from `date_start` to `date_end`; see nights.compute_nights.
+    """
+    logger.debug('populate interactive nights...')
+
+    title = f"Nightly visibility from {date_start} to {date_end}"
+    TOOLS = "pan,wheel_zoom,box_zoom,reset,save"
+    fig_args = {"title": title, "tools": TOOLS, "toolbar_location": 'above', "width": 1580}
+
+    dates = nights.night_dates(date_start, date_end)
+    errors = [f'name={t.name}, coord={t.coord}, equinox={t.equinox}. err={t.err}' for t in target_list if t.err]
+    valid = [t for t in target_list if not t.err]
+
+    plot = NightsPlot(logger, **fig_args)
+    if not valid:
+        return (plot.fig, errors)
+
+    if progress is not None:
+        progress(f'computing {len(dates)} nights of {len(valid)} targets')
+    with metrics.stage('ephemeris'):
+        res = nights.compute_nights(mysite, dates, valid, logger=logger)
+
+    if progress is not None:
+        progress(f'plotting {len(valid)} targets')
+    with metrics.stage('bokeh_models'):
+        plot.plot_nights(res, alt_limit=ALT_LOW)
+
     return (plot.fig, errors)
 
-def populate_interactive_laser(target, collision_time, mysite, mydate, logger):
-    logger.debug('populate_interactive_laser...')
+def populate_visibility(target_list, mysite, mydate, logger, time_interval=None, date_end=None, progress=None):
+    """
+    The visibility plot of the night of `mydate`, or the nightly heatmap
+    if `date_end` is a later date.
+    """
+    if date_end and date_end != mydate:
+        return populate_interactive_nights(target_list, mysite, mydate, date_end, logger, progress=progress)
+
+    return populate_interactive_target(target_list, mysite, mydate, logger,
+                                       time_interval=time_interval, progress=progress)
 
-    mydate = f'{mydate} 17:00:00'
-    mysite.set_date(mysite.get_date(mydate))
+def _laser_layout(ctx, target, tgt_calc, collision_time, almanac, logger):
+    from .laser_plot import LaserPlot
 
-    title = f"Laser collision for the night of {mydate}"
-    mydate_time = f'{mydate} 17:00:00'
-    #mysite.set_date(mysite.get_date(mydate_time))
+    title = f"Laser collision for the night of {ctx.date.strftime('%Y-%m-%d')}"
 
-    logger.debug(f'my date={mydate}')
     TOOLS = "pan,wheel_zoom,box_zoom,reset,save"
     toolbar_location = 'above'
     plot_height = 930
     plot_width = 1000
 
-    sizing_mode = 'scale_both' #'stretch_both'
     # note: output_backend: webgl is to optimize drawings, but can't draw dotted line
-    #fig_args = {"x_axis_type": "datetime",  "title": title, "tools": TOOLS, "toolbar_location": toolbar_location, "sizing_mode": sizing_mode} #  "output_backend": "webgl"}
-
-    fig_args = {"x_axis_type": "datetime",  "title": title, "tools": TOOLS, "toolbar_location": toolbar_location, "height": plot_height, "width": plot_width} # "sizing_mode": sizing_mode} #  "output_backend": "webgl"}
+    fig_args = {"x_axis_type": "datetime",  "title": title, "tools": TOOLS, "toolbar_location": toolbar_location, "height": plot_height, "width": plot_width}
 
     plot = LaserPlot(logger, **fig_args)
-    tgt = StaticTarget(name=target.name, ra=target.ra, dec=target.dec, equinox=target.equinox)
     tgt_info = Bunch.Bunch(name=target.name, ra=target.ra, dec=target.dec)
-    tgt_calc = mysite.get_target_info(tgt)
     tgt_data = Bunch.Bunch(tgt_calc=tgt_calc, tgt_info=tgt_info)
 
     try:
         logger.debug('calling plot_laser...')
-        plot.plot_laser(mysite, tgt_data, collision_time)
+        plot.plot_laser(ctx, tgt_data, collision_time, almanac=almanac)
     except Exception as e:
         #print(e)
         raise TargetError(f"error: {e}")
@@ -456,3 +710,37 @@ def populate_interactive_laser(target, collision_time, mysite, mydate, logger):
     else:
         logger.debug('returning plot fig...')
         return row(plot.fig, column(plot.toggles))
+
+def populate_interactive_lasers(targets, mysite, mydate, logger, time_interval=None):
+    """
+    Build the laser plots of all `targets` for the night of `mydate`.
+    The night's almanac is looked up once and shared by every plot, and
+    all trajectories are computed in one batch.
+
+    Returns (plots, errors), where plots is a list of (target, layout)
+    sorted by target, and errors lists the targets that failed to plot.
+    """
+    logger.debug('populate_interactive_lasers...')
+
+    ctx = observing_context(mysite, mydate)
+    time_interval = sampling.time_interval(time_interval)
+
+    targets = sorted(targets, key=lambda i: (i.name, i.ra, i.dec))
+    with metrics.stage('ephemeris'):
+        almanac = night_almanac(ctx, logger)
+        batch = trajectory.cached_trajectories(ctx, targets, time_interval=time_interval, logger=logger)
+
+    plots = []
+    errors = []
+
+    with metrics.stage('bokeh_models'):
+        for i, target in enumerate(targets):
+            try:
+                laser_layout = _laser_layout(ctx, target, batch.target_calc(i), target.safe_time, almanac, logger)
+            except Exception as e:
+                logger.error(f'Error: failed to populate laser plot. {e}')
+                errors.append(f'Plotting laser collision for {target.name}. {e}')
+            else:
+                plots.append((target, laser_layout))
+
+    return (plots, errors)
@@ -0,0 +1,78 @@
+import io
+import threading
+from contextlib import contextmanager
+
+# matplotlib is imported with the first image, not with the app
+
+# static image formats and their content types
+IMAGE_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+DEFAULT_WIDTH = 1200
+DEFAULT_HEIGHT = 740
+MIN_SIZE = 200
+MAX_SIZE = 3000
+
+# idle plots kept for reuse, over all image sizes
+CANVAS_POOL_SIZE = 4
+
+
+class CanvasPool:
+    """
+    Idle AirMassPlot2 figures with their Agg canvas, kept per image size
+    so that rendering an image does not set up a new figure every time.
+    """
+    def __init__(self, maxsize=CANVAS_POOL_SIZE):
+        self.maxsize = maxsize
+        self._idle = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def plot(self, width, height, logger):
+        """Borrow a plot of `width` x `height` pixels, returning it afterwards."""
+        key = (width, height)
+        plot = None
+        with self._lock:
+            if self._idle.get(key):
+                plot = self._idle[key].pop()
+                self._count -= 1
+
+        if plot is None:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from .airmass2 import AirMassPlot2
+
+            plot = AirMassPlot2(width, height, logger=logger)
+            FigureCanvasAgg(plot.fig)
+
+        try:
+            yield plot
+        finally:
+            # drop the artists now rather than when the figure is reused
+            plot.fig.clf()
+            with self._lock:
+                if self._count < self.maxsize:
+                    self._idle.setdefault(key, []).append(plot)
+                    self._count += 1
+
+_pool = CanvasPool()
+
+
+def image_size(width=None, height=None):
+    """Image size in pixels from request values, clipped to the allowed range."""
+    width = int(width) if width else DEFAULT_WIDTH
+    height = int(height) if height else DEFAULT_HEIGHT
+    return (min(max(width, MIN_SIZE), MAX_SIZE), min(max(height, MIN_SIZE), MAX_SIZE))
+
+def render_visibility(ctx, tgt_data, almanac, fmt='png', width=DEFAULT_WIDTH,
+                      height=DEFAULT_HEIGHT, logger=None):
+    """
+    Render the visibility chart of `tgt_data` (as for TargetPlot) for
+    the night of `ctx` to PNG or SVG bytes.
+    """
+    with _pool.plot(width, height, logger) as plot:
+        # savefig renders the figure; drawing it before would render it twice
+        plot.plot_visibility(ctx, tgt_data, almanac, draw=False)
+        buf = io.BytesIO()
+        plot.fig.savefig(buf, format=fmt)
+
+    return buf.getvalue()
@@ -0,0 +1,118 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import SizedLRUCache
+
+# background threads computing large plots; 0 computes every request inline
+JOB_WORKERS = 2
+# requests with at least this many bytes of uploads are run as jobs
+JOB_MIN_UPLOAD_BYTES = 256 * 1024
+# total size of the jobs kept for polling and fetching, finished or not
+JOB_HISTORY_BYTES = 64 * 1024**2
+# bytes counted for a job besides its result
+JOB_BASE_BYTES = 1024
+
+_executor = None
+_lock = threading.Lock()
+_submit_lock = threading.Lock()
+
+
+class Job:
+    """
+    A plot computed in the background.  The worker updates state,
+    message and result; the polling requests only read them.
+    """
+    def __init__(self, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.state = 'queued'
+        self.message = 'waiting for a worker'
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.errors = []
+
+    def progress(self, message):
+        self.message = message
+
+    def status(self):
+        end = self.finished or time.time()
+        return dict(id=self.id, state=self.state, message=self.message,
+                    elapsed=round(end - self.created, 1))
+
+
+def sizeof(job):
+    """Approximate bytes held by `job`: the strings of its result, e.g. a plot's script and div."""
+    size = JOB_BASE_BYTES
+    if isinstance(job.result, dict):
+        size += sum(len(value) for value in job.result.values() if isinstance(value, (str, bytes)))
+    return size
+
+def finished(job):
+    """Only finished jobs are evicted; queued and running ones are polled."""
+    return job.finished is not None
+
+_jobs = SizedLRUCache(maxbytes=JOB_HISTORY_BYTES, sizeof=sizeof, evictable=finished)
+
+def init_app(app):
+    """Read the job settings from the application config."""
+    global JOB_WORKERS, JOB_MIN_UPLOAD_BYTES, _jobs
+
+    JOB_WORKERS = app.config.get('JOB_WORKERS', JOB_WORKERS)
+    JOB_MIN_UPLOAD_BYTES = app.config.get('JOB_MIN_UPLOAD_BYTES', JOB_MIN_UPLOAD_BYTES)
+    maxbytes = app.config.get('JOB_HISTORY_BYTES', JOB_HISTORY_BYTES)
+    _jobs = SizedLRUCache(maxbytes=maxbytes, sizeof=sizeof, evictable=finished)
+    app.logger.debug(f'job workers={JOB_WORKERS}, min upload bytes={JOB_MIN_UPLOAD_BYTES}, history bytes={maxbytes}')
+
+def use_jobs(upload_bytes):
+    return JOB_WORKERS > 0 and (upload_bytes or 0) >= JOB_MIN_UPLOAD_BYTES
+
+def get_executor():
+    """Return the job threads, starting them on first use."""
+    global _executor
+
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+        return _executor
+
+def submit(func, *args, key=None, logger=None):
+    """
+    Run func(job, *args) in the background and return the job right
+    away; func's return value becomes job.result.  A job submitted with
+    a `key`, e.g. the request's response_cache.request_key(), gets the
+    key as its id: while a job with that key is kept and has not failed,
+    it is returned instead of starting another one.
+    """
+    with _submit_lock:
+        job = _jobs.get(key) if key is not None else None
+        if job is not None and job.state != 'failed':
+            return job
+
+        job = Job(key)
+        _jobs.put(job.id, job)
+    get_executor().submit(_run, job, func, args, logger)
+    return job
+
+def _run(job, func, args, logger):
+    job.state = 'running'
+    job.progress('started')
+    try:
+        job.result = func(job, *args)
+    except Exception as e:
+        if logger is not None:
+            logger.error(f'Error: job {job.id} failed. {e}')
+        job.errors.append(f'{e}')
+        job.state = 'failed'
+        job.progress('failed')
+    else:
+        job.state = 'done'
+        job.progress('done')
+    finally:
+        job.finished = time.time()
+        # account for the result's size now that it is known
+        _jobs.put(job.id, job)
+
+def get_job(job_id):
+    return _jobs.get(job_id)
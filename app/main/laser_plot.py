@@ -1,7 +1,6 @@
 from datetime import datetime, timedelta
 import time
 from dateutil import tz
-import pytz
 import numpy as np
 from math import pi, isclose
 
@@ -22,8 +21,12 @@ from bokeh.models import Span
 
 try:
     from .base_plot import BasePlot
+    from . import sampling
+    from .logutil import summary
 except:
     from base_plot import BasePlot
+    import sampling
+    from logutil import summary
 
 from ginga.misc import Bunch
 
@@ -37,22 +40,23 @@ class LaserPlot(BasePlot):
 
         self.toggles = []
 
-    def plot_laser(self, site, tgt_data,  collision_time):
+    def plot_laser(self, ctx, tgt_data,  collision_time, almanac=None):
         """
         Top-level routine: draws base plot, collision boxes, target trajectory and moon.
         - tgt_entry is expected to be an object with .tgt_calc and .tgt_info (Bunch or dataclass)
-        - collision_time is iterable of (start_dt, end_dt) pairs (naive or tz-aware)
+        - collision_time has tz-aware .start and .end arrays of the safe windows
+        - almanac, if given, is the night's almanac shared by several plots
         """
         self.logger.debug('plot_laser...')
-        timezone = site.tz_local
+        timezone = ctx.tz
 
         self.logger.debug('plot_base...')
-        self.plot_base(site)
-        self.collision(site, collision_time)
+        self.plot_base(ctx, almanac=almanac)
+        self.collision(ctx, collision_time)
         self.logger.debug('target trajecotry...')
-        self.target_trajectory(tgt_data, site)
+        self.target_trajectory(tgt_data, ctx)
         self.logger.debug('moon trajecotry...')
-        self.moon_trajectory(tgt_data,  site)
+        self.moon_trajectory(tgt_data, ctx)
         self.fig.legend.click_policy = "hide"
         self.logger.debug('plot_laser done...')
 
@@ -60,7 +64,7 @@ class LaserPlot(BasePlot):
     # Moon distance annotations
     # ---------------------------
     def moon_distance(self, moon_sep, lt_data, alt_data, color):
-        min_interval = 12  # every ~1 hr (5 min steps assumed)
+        min_interval = sampling.marker_step(lt_data)  # every ~1 hr
         mt = lt_data[0:-1:min_interval]
         moon_sep = moon_sep[0:-1:min_interval]
         alt_interval = alt_data[0:-1:min_interval]
@@ -80,16 +84,15 @@ class LaserPlot(BasePlot):
     # ---------------------------
     # Moon trajectory
     # ---------------------------
-    def moon_trajectory(self, tgt_data, site):
+    def moon_trajectory(self, tgt_data, ctx):
         moon_data = tgt_data.tgt_calc.moon_alt
-        moon_lt_data = [dt.astimezone(site.tz_local) for dt in tgt_data.tgt_calc.lt]
+        moon_lt_data = [dt.astimezone(ctx.tz) for dt in tgt_data.tgt_calc.lt]
 
         illum_time = moon_lt_data[moon_data.argmax()]
-        moon_illum = site.moon_phase(date=illum_time)
+        moon_illum = ctx.site.moon_phase(date=illum_time)
 
-        moon = self.fig.line(
-            moon_lt_data,
-            moon_data,
+        moon = self._line(
+            *sampling.decimate(moon_lt_data, moon_data),
             line_color="orange",
             line_alpha=0.7,
             line_dash="dashed",
@@ -107,19 +110,18 @@ class LaserPlot(BasePlot):
     # ---------------------------
     # Target trajectory
     # ---------------------------
-    def target_trajectory(self, tgt_data, site):
+    def target_trajectory(self, tgt_data, ctx):
         """
         Plot a single target's altitude curve and moon-distance markers.
         Expects tgt_entry.tgt_calc.alt_deg and .lt.
         """
-        lt_data = [dt.astimezone(site.tz_local) for dt in tgt_data.tgt_calc.lt]
+        lt_data = [dt.astimezone(ctx.tz) for dt in tgt_data.tgt_calc.lt]
         alt_data = tgt_data.tgt_calc.alt_deg
         moon_sep = tgt_data.tgt_calc.moon_sep
-        self.logger.debug(f'lt_data={lt_data}')
-        self.logger.debug(f'alt_data={alt_data}')
+        self.logger.debug('lt_data=%s, alt_data=%s', summary(lt_data), summary(alt_data))
 
         target_color = 'red'
-        target = self.fig.line(lt_data, alt_data, line_color=target_color, line_width=3)
+        target = self.fig.line(*sampling.decimate(lt_data, alt_data), line_color=target_color, line_width=3)
 
         self.logger.debug('calling moon distance..')
         moon_markers = self.moon_distance(moon_sep, lt_data, alt_data, target_color)
@@ -132,20 +134,18 @@ class LaserPlot(BasePlot):
     # ---------------------------
     # Collision bands and toggles
     # ---------------------------
-    def collision(self, site, collision_time):
+    def collision(self, ctx, collision_time):
         """
         Draws BoxAnnotation for each (start,end) pair and creates a Toggle that
         shows/hides the corresponding BoxAnnotation.
-        - collision_time_iterable: iterable of (start_dt, end_dt)
+        - collision_time: .start and .end arrays of tz-aware window times
         """
-        self.logger.debug('drawing collision...')
+        self.logger.debug('drawing collision... windows=%s', len(collision_time.start))
         code = '''object.visible = toggle.active'''
 
-        for s, e in collision_time:
-            self.logger.debug(f'start={s}, end={e}, tz={site.timezone}')
-            s = pytz.timezone("US/Hawaii").localize(s)
-            e = pytz.timezone("US/Hawaii").localize(e)
-
+        # plain datetimes: Bokeh plots their wall-clock time, as for the trajectories,
+        # while pandas Timestamps would be converted to UTC
+        for s, e in zip(collision_time.start.to_pydatetime(), collision_time.end.to_pydatetime()):
             callback = CustomJS(code=code, args={})
             toggle = Toggle(label="{}-{}".format(s.strftime("%Y-%m-%d %H:%M:%S"), e.strftime("%H:%M:%S")), button_type="default", active=True, width=20, height=25)
             toggle.js_on_click(callback)
@@ -0,0 +1,81 @@
+import numpy as np
+
+# Helpers for debug logging in the request paths.  Messages there use
+# the logger's %-style arguments, so nothing is formatted unless the
+# level is enabled, and large values (uploads, DataFrames, trajectory
+# arrays, target lists) are logged through summary() so that a single
+# message stays short even for thousands of targets.
+
+# items shown of a long sequence
+SUMMARY_ITEMS = 3
+
+# longest text logged as is
+SUMMARY_CHARS = 200
+
+
+def _shorten(text, chars=SUMMARY_CHARS):
+    if len(text) <= chars:
+        return text
+    return f'{text[:chars]}... ({len(text)} chars)'
+
+def summarize(value, items=SUMMARY_ITEMS):
+    """A short description of `value` for a log message."""
+
+    if isinstance(value, (bytes, bytearray)):
+        return f'<{len(value)} bytes>'
+
+    if isinstance(value, str):
+        return _shorten(value)
+
+    # DataFrame
+    if hasattr(value, 'columns') and hasattr(value, 'shape'):
+        rows, cols = value.shape
+        return f'<DataFrame rows={rows} columns={list(value.columns)}>'
+
+    if isinstance(value, np.ndarray):
+        if value.size <= items:
+            return repr(value.tolist())
+        res = f'<array shape={value.shape} dtype={value.dtype}'
+        if value.dtype.kind in 'iuf' and not np.isnan(value).all():
+            res += f' min={np.nanmin(value):.4g} max={np.nanmax(value):.4g}'
+        return res + '>'
+
+    if isinstance(value, (list, tuple)):
+        if len(value) <= items:
+            return _shorten(repr(value))
+        first = ', '.join(_shorten(repr(v), SUMMARY_CHARS // items) for v in value[:items])
+        return f'<{type(value).__name__} len={len(value)} first=[{first}, ...]>'
+
+    return _shorten(repr(value))
+
+class summary:
+    """
+    Wraps a value for a log message, e.g.
+    logger.debug('targets=%s', summary(targets)); it is only
+    summarized if the message is emitted.
+    """
+    __slots__ = ('value', 'items')
+
+    def __init__(self, value, items=SUMMARY_ITEMS):
+        self.value = value
+        self.items = items
+
+    def __str__(self):
+        return summarize(self.value, self.items)
+
+    __repr__ = __str__
+
+
+if __name__ == '__main__':
+
+    import logging
+    import pandas as pd
+
+    logging.basicConfig(level=logging.DEBUG)
+    logger = logging.getLogger('logutil')
+
+    logger.debug('bytes=%s', summary(b'x' * 100000))
+    logger.debug('df=%s', summary(pd.DataFrame(dict(name=['a'] * 1000, ra=['0'] * 1000))))
+    logger.debug('alt=%s', summary(np.linspace(-10, 80, 289)))
+    logger.debug('targets=%s', summary([dict(name=f't{i}') for i in range(5000)]))
+    logger.info('not summarized=%s', summary([1, 2]))
@@ -0,0 +1,115 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from flask import g, request, has_request_context
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# addresses allowed to read the metrics
+METRICS_ALLOW = ('127.0.0.1', '::1')
+
+
+class Histogram:
+    """
+    A thread-safe Prometheus-style histogram with one series per tuple
+    of label values.
+    """
+    def __init__(self, name, doc, labels, buckets=BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, values, seconds):
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    def expose(self):
+        """Lines of the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((values, list(counts), total, count)
+                            for values, (counts, total, count) in self._series.items())
+
+        for values, counts, total, count in series:
+            labels = ','.join(f'{k}="{v}"' for k, v in zip(self.labels, values))
+            cumulative = 0
+            for bound, num in zip(self.buckets, counts):
+                cumulative += num
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+stage_seconds = Histogram('tgtvis_stage_seconds', 'Time spent in each stage of a request.',
+                          ('endpoint', 'stage'))
+request_seconds = Histogram('tgtvis_request_seconds', 'Time spent handling a request.',
+                            ('endpoint',))
+
+
+def init_app(app):
+    """Read the metrics settings from the application config."""
+    global METRICS_ALLOW
+
+    METRICS_ALLOW = tuple(app.config.get('METRICS_ALLOW', METRICS_ALLOW))
+    app.logger.debug(f'metrics allowed from {METRICS_ALLOW}')
+
+def observe(name, seconds):
+    """
+    Record a stage of `seconds`: in the histogram and, inside a request,
+    for its Server-Timing header.  Stages run by background jobs are
+    recorded under the endpoint 'job'.
+    """
+    if has_request_context():
+        endpoint = request.endpoint or 'unknown'
+        g.setdefault('timings', []).append((name, seconds))
+    else:
+        endpoint = 'job'
+    stage_seconds.observe((endpoint, name), seconds)
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as the stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+def server_timing(timings, total=None):
+    """The Server-Timing header value of (name, seconds) timings, in ms."""
+    items = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings]
+    if total is not None:
+        items.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(items)
+
+def expose(caches):
+    """
+    The metrics in the Prometheus text format: the histograms and the
+    hit/miss/size statistics of `caches`, a dict of name: stats.
+    """
+    lines = stage_seconds.expose() + request_seconds.expose()
+
+    for key, doc in [('hits', 'Cache hits.'), ('misses', 'Cache misses.'),
+                     ('entries', 'Cache entries.'), ('bytes', 'Size of the cached values.')]:
+        name = f'tgtvis_cache_{key}'
+        lines += [f'# HELP {name} {doc}', f'# TYPE {name} gauge']
+        for cache, stats in sorted(caches.items()):
+            if key in stats:
+                lines.append(f'{name}{{cache="{cache}"}} {stats[key]}')
+
+    return '\n'.join(lines) + '\n'
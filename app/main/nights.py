@@ -0,0 +1,152 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from qplan.util.calcpos import alt2airmass
+from ginga.misc import Bunch
+
+try:
+    from .trajectory import horizon_frame, target_vectors, to_local
+    from .base_plot import ALT_LOW
+    from .observability import crossing, time_in_band
+    from . import ephemeris
+except:
+    from trajectory import horizon_frame, target_vectors, to_local
+    from base_plot import ALT_LOW
+    from observability import crossing, time_in_band
+    import ephemeris
+
+# Nightly visibility of a target list over a range of nights, e.g. a
+# semester, for proposal preparation.  Every night is sampled from local
+# noon to the next noon; the samples of all nights are computed in one
+# skyfield call and reduced per night with array operations.
+
+# longest date range, about a semester
+MAX_NIGHTS = 184
+# step of the nightly grid, in minutes
+NIGHTS_TIME_INTERVAL = 10
+# sun altitude of astronomical darkness, in degrees
+DARK_SUN_ALT = -18.0
+# target-samples computed at once; bounds the memory of long lists
+CHUNK_SAMPLES = 2_000_000
+
+
+def init_app(app):
+    """Read the multi-night settings from the application config."""
+    global MAX_NIGHTS, NIGHTS_TIME_INTERVAL
+
+    MAX_NIGHTS = app.config.get('NIGHTS_MAX', MAX_NIGHTS)
+    NIGHTS_TIME_INTERVAL = app.config.get('NIGHTS_TIME_INTERVAL', NIGHTS_TIME_INTERVAL)
+    app.logger.debug(f'max nights={MAX_NIGHTS}, nights time interval={NIGHTS_TIME_INTERVAL} min')
+
+def night_dates(date_start, date_end):
+    """The dates from `date_start` to `date_end` ('YYYY-MM-DD'), inclusive."""
+    start = date.fromisoformat(date_start)
+    end = date.fromisoformat(date_end)
+
+    num = (end - start).days + 1
+    if num < 1:
+        raise ValueError(f"the end date is before the start date. {date_start} - {date_end}")
+    if num > MAX_NIGHTS:
+        raise ValueError(f"at most {MAX_NIGHTS} nights. {date_start} - {date_end} is {num} nights")
+
+    return [start + timedelta(days=i) for i in range(num)]
+
+def _dark_window(secs, sun_alt, dark):
+    """
+    Start and end (D,) of the darkness of each night, interpolated
+    between the samples `secs` (D, S) where the sun passes DARK_SUN_ALT;
+    both are the night's first sample if it has no darkness.
+    """
+    samples = sun_alt.shape[-1]
+    first = np.argmax(dark, axis=-1)
+    last = samples - 1 - np.argmax(dark[:, ::-1], axis=-1)
+    start = np.where(first > 0, crossing(secs, sun_alt, np.maximum(first - 1, 0), first, DARK_SUN_ALT), secs[:, 0])
+    end = np.where(last < samples - 1,
+                   crossing(secs, sun_alt, last, np.minimum(last + 1, samples - 1), DARK_SUN_ALT), secs[:, -1])
+
+    has_dark = dark.any(axis=-1)
+    return np.where(has_dark, start, secs[:, 0]), np.where(has_dark, end, secs[:, 0])
+
+def compute_nights(site, dates, targets, time_interval=None, logger=None):
+    """
+    Compute nightly metrics of `targets` (as for compute_trajectories) on
+    the nights beginning at `dates`.  Returns a Bunch of names, dates and
+    (N, D) arrays:
+
+    - hours: hours above ALT_LOW during astronomical darkness
+    - airmass: best airmass during darkness (NaN if never above the horizon)
+    - moon_sep: moon separation at the target's highest dark sample
+    """
+    if time_interval is None:
+        time_interval = NIGHTS_TIME_INTERVAL
+
+    ts = ephemeris.timescale()
+    per_night = int(round(24 * 60 / time_interval))
+    offsets = np.arange(per_night) * time_interval / (24 * 60)
+    noons = ts.from_datetimes([site.get_date(f'{d} 12:00:00') for d in dates])
+    jd = noons.tt[:, None] + offsets[None, :]  # (D, S)
+    t = ts.tt_jd(jd.ravel())
+
+    observer = ephemeris.location(site).at(t)
+    frame = horizon_frame(observer)
+
+    num_nights = len(dates)
+    sun_alt = observer.observe(ephemeris.body('sun')).apparent().altaz()[0].degrees.reshape(num_nights, per_night)
+    dark = sun_alt < DARK_SUN_ALT
+    has_dark = dark.any(axis=-1)
+    secs = jd * 86400
+    dark_start, dark_end = _dark_window(secs, sun_alt, dark)
+    moon_vec = frame.moon_vec.reshape(num_nights, per_night, 3)
+
+    vectors = target_vectors(targets)
+    num = len(targets)
+    hours = np.empty((num, num_nights))
+    best_alt = np.empty((num, num_nights))
+    moon_sep = np.empty((num, num_nights))
+
+    chunk = max(1, CHUNK_SAMPLES // len(t))
+    nights = np.arange(num_nights)
+    for start in range(0, num, chunk):
+        s = slice(start, start + chunk)
+        local = to_local(frame.basis, vectors[s]).reshape(-1, num_nights, per_night, 3)
+        alt = np.degrees(np.arcsin(np.clip(local[..., 2], -1.0, 1.0)))  # (n, D, S)
+
+        hours[s] = time_in_band(secs, alt, ALT_LOW, 90.0, dark_start, dark_end) / 3600
+        top = np.argmax(np.where(dark, alt, -np.inf), axis=-1)  # (n, D)
+        best_alt[s] = np.take_along_axis(alt, top[..., None], axis=-1)[..., 0]
+
+        top_vec = np.take_along_axis(local, top[..., None, None], axis=2)[:, :, 0]  # (n, D, 3)
+        cos_sep = np.einsum('ndi,ndi->nd', top_vec, moon_vec[nights, top])
+        moon_sep[s] = np.degrees(np.arccos(np.clip(cos_sep, -1.0, 1.0)))
+
+    best_alt[:, ~has_dark] = np.nan
+    moon_sep[:, ~has_dark] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        airmass = np.where(best_alt > 0, alt2airmass(np.clip(best_alt, 0.1, 90.0)), np.nan)
+
+    if logger is not None:
+        logger.debug('computed nights. targets=%s, nights=%s, samples=%s', num, num_nights, len(t))
+
+    return Bunch.Bunch(names=[tgt.name for tgt in targets], dates=list(dates),
+                       hours=hours, airmass=airmass, moon_sep=moon_sep)
+
+
+if __name__ == '__main__':
+    import time
+    import logging
+    from qplan.util.site import get_site
+
+    logger = logging.getLogger()
+    site = get_site('subaru')
+
+    rng = np.random.default_rng(0)
+    targets = [Bunch.Bunch(name=f'T{i}', ra=f'{int(r):02d}:{int(r % 1 * 60):02d}:00.0',
+                           dec=f'{int(d):+03d}:00:00.0', equinox=2000.0)
+               for i, (r, d) in enumerate(zip(rng.uniform(0, 24, 100), rng.uniform(-30, 80, 100)))]
+
+    dates = night_dates('2024-02-01', '2024-07-31')
+    start = time.perf_counter()
+    res = compute_nights(site, dates, targets, logger=logger)
+    print(f'{len(targets)} targets x {len(dates)} nights: {time.perf_counter() - start:.2f}s')
+    print(f'{res.names[0]}: hours={np.round(res.hours[0, :7], 1)} airmass={np.round(res.airmass[0, :7], 2)}')
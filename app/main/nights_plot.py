@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from bokeh.plotting import figure
+from bokeh.models import ColumnDataSource, LinearColorMapper, ColorBar, HoverTool, FactorRange
+from bokeh.palettes import Viridis256
+
+from ginga.misc import Bunch
+
+try:
+    from .base_plot import ALT_LOW
+except:
+    from base_plot import ALT_LOW
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+class NightsPlot:
+    """
+    Heatmap of nightly visibility: one row per target, one column per
+    night, colored by the hours above the altitude limit in darkness.
+    """
+    def __init__(self, logger=None, **fig_args):
+        self.logger = logger
+        self.logger.debug("Initializing NightsPlot with args: %s", fig_args)
+        self.fig = figure(x_axis_type='datetime', y_range=FactorRange(), output_backend='webgl', **fig_args)
+
+    def plot_nights(self, res, alt_limit=ALT_LOW):
+        """Draw the metrics `res` of nights.compute_nights."""
+        num, num_nights = res.hours.shape
+        self.logger.debug('plotting nights. targets=%s, nights=%s', num, num_nights)
+
+        # cells are centred on each date; the axis shows dates only
+        days = np.array([datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp() * 1000
+                         for d in res.dates])
+
+        # first target at the top; names need not be unique
+        labels = [f'{i + 1}: {name}' for i, name in enumerate(res.names)]
+
+        def cell(arr, decimals):
+            return np.round(arr, decimals).ravel()
+
+        source = ColumnDataSource(data=dict(
+            x=np.tile(days, num),
+            y=np.repeat(labels, num_nights),
+            date=[d.isoformat() for d in res.dates] * num,
+            hours=cell(res.hours, 2),
+            airmass=cell(res.airmass, 2),
+            moon_sep=cell(res.moon_sep, 1)))
+
+        self.fig.y_range.factors = labels[::-1]
+        self.fig.height = min(max(300, 20 * num + 150), 4000)
+
+        mapper = LinearColorMapper(palette=Viridis256, low=0, high=max(float(np.nanmax(res.hours, initial=0)), 1))
+        self.fig.rect(x='x', y='y', width=MS_PER_DAY, height=1, source=source,
+                      fill_color=dict(field='hours', transform=mapper), line_color=None)
+
+        self.fig.add_layout(ColorBar(color_mapper=mapper, title=f'hours above {alt_limit:.0f}°'), 'right')
+        self.fig.add_tools(HoverTool(tooltips=[('target', '@y'), ('night', '@date'),
+                                               (f'hours > {alt_limit:.0f}°', '@hours'),
+                                               ('best airmass', '@airmass'),
+                                               ('moon sep at max alt', '@moon_sep°')]))
+
+        self.fig.xaxis.axis_label = 'Night'
+        self.fig.yaxis.axis_label = 'Target'
+        self.fig.grid.visible = False
+        self.fig.yaxis.major_label_text_font_size = '8pt' if num > 40 else '10pt'
+
+
+if __name__ == '__main__':
+    import logging
+    from datetime import date, timedelta
+    from bokeh.plotting import show
+
+    logger = logging.getLogger()
+
+    dates = [date(2024, 2, 1) + timedelta(days=i) for i in range(60)]
+    rng = np.random.default_rng(0)
+    res = Bunch.Bunch(names=['S5', 'Sf', 'hello'], dates=dates,
+                      hours=rng.uniform(0, 8, (3, 60)), airmass=rng.uniform(1, 2, (3, 60)),
+                      moon_sep=rng.uniform(0, 180, (3, 60)))
+
+    plot = NightsPlot(logger, title='Nightly visibility', width=1200)
+    plot.plot_nights(res)
+    show(plot.fig)
@@ -0,0 +1,128 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from qplan.util.calcpos import alt2airmass
+from ginga.misc import Bunch
+
+try:
+    from .base_plot import ALT_LOW, ALT_HIGH
+except:
+    from base_plot import ALT_LOW, ALT_HIGH
+
+# Per-target observability numbers of one night, computed from the
+# trajectory arrays of a TrajectoryBatch without drawing anything; each
+# quantity is one array operation over all targets.
+
+# columns of the summary table, in order
+COLUMNS = ['name', 'ra', 'dec', 'rise', 'set', 'highest', 'max_alt', 'min_airmass',
+           'dark_hours', 'moon_sep_min']
+
+
+def crossing(secs, alt, lo, hi, limit):
+    """
+    Times where the altitude passes `limit` between samples lo and hi
+    (N,) of the rows of `alt` (N, S), interpolated; `secs` are the
+    sample times, (S,) or one row per row of `alt` (N, S).
+    """
+    rows = np.arange(alt.shape[0])
+    secs = np.broadcast_to(secs, alt.shape)
+    a0, a1 = alt[rows, lo], alt[rows, hi]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(a1 != a0, (limit - a0) / (a1 - a0), 0.0)
+    return secs[rows, lo] + frac * (secs[rows, hi] - secs[rows, lo])
+
+def time_in_band(secs, alt, lo, hi, start, end):
+    """
+    Seconds during which the altitude is between `lo` and `hi` within
+    the window `start`-`end`, with the altitude linear between samples.
+    `alt` is (..., S) over the sample times `secs`, (S,) or broadcastable
+    to `alt`; `start` and `end` are times broadcastable to alt.shape[:-1].
+    """
+    t0, t1 = secs[..., :-1], secs[..., 1:]
+    a0, a1 = alt[..., :-1], alt[..., 1:]
+    dt = t1 - t0
+    start = np.asarray(start, dtype=float)[..., None]
+    end = np.asarray(end, dtype=float)[..., None]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # fractions of each segment inside the window
+        w0 = np.clip((start - t0) / dt, 0.0, 1.0)
+        w1 = np.clip((end - t0) / dt, 0.0, 1.0)
+        # and inside the altitude band; a flat segment is all in or all out
+        da = a1 - a0
+        u_lo = (lo - a0) / da
+        u_hi = (hi - a0) / da
+        inside = (a0 >= lo) & (a0 <= hi)
+        b0 = np.where(da != 0, np.minimum(u_lo, u_hi), np.where(inside, 0.0, 1.0))
+        b1 = np.where(da != 0, np.maximum(u_lo, u_hi), np.where(inside, 1.0, 0.0))
+
+    frac = np.minimum(w1, b1) - np.maximum(w0, b0)
+    return (np.clip(frac, 0.0, None) * dt).sum(axis=-1)
+
+def summarize(batch, almanac, alt_limit=ALT_LOW, alt_max=ALT_HIGH):
+    """
+    Observability of the targets of `batch` on the night of `almanac`.
+    Returns a Bunch of (N,) arrays, times in seconds since the epoch:
+
+    - rise, set: first rise above and last set below `alt_limit`; the
+      start (end) of the night if the target is already (still) up, NaN
+      if it never gets there
+    - highest, max_alt, min_airmass: time, altitude and airmass of the
+      highest sample in the night; not the transit, which may be in
+      daytime, when this is the start or end of the night
+    - dark_hours: hours between `alt_limit` and `alt_max` during
+      astronomical darkness (18 degree twilights)
+    - moon_sep_min: smallest moon separation in the night
+    """
+    alt = batch.alt_deg
+    num, samples = alt.shape
+    secs = np.array([dt.timestamp() for dt in batch.ut])
+
+    above = alt >= alt_limit
+    up = above.any(axis=1)
+
+    first = np.argmax(above, axis=1)
+    last = samples - 1 - np.argmax(above[:, ::-1], axis=1)
+    rise = np.where(first > 0, crossing(secs, alt, np.maximum(first - 1, 0), first, alt_limit), secs[0])
+    set_ = np.where(last < samples - 1, crossing(secs, alt, last, np.minimum(last + 1, samples - 1), alt_limit), secs[-1])
+    rise[~up] = np.nan
+    set_[~up] = np.nan
+
+    top = np.argmax(alt, axis=1)
+    max_alt = alt[np.arange(num), top]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        min_airmass = np.where(max_alt > 0, alt2airmass(np.clip(max_alt, 0.1, 90.0)), np.nan)
+
+    dark_hours = time_in_band(secs, alt, alt_limit, alt_max,
+                              almanac.et18.timestamp(), almanac.mt18.timestamp()) / 3600
+
+    return Bunch.Bunch(rise=rise, set=set_, highest=secs[top], max_alt=max_alt,
+                       min_airmass=min_airmass, dark_hours=dark_hours,
+                       moon_sep_min=batch.moon_sep.min(axis=1))
+
+def table_rows(valid, res, tz):
+    """
+    Rows of the summary table: one Bunch per target with the COLUMNS
+    formatted for display, and `key`, the raw values to sort by.
+    """
+    def hhmm(val):
+        if np.isnan(val):
+            return ''
+        return datetime.fromtimestamp(val, timezone.utc).astimezone(tz).strftime('%H:%M')
+
+    def num(val, fmt):
+        return '' if np.isnan(val) else format(val, fmt)
+
+    rows = []
+    for i, t in enumerate(valid):
+        key = {col: res[col][i] for col in COLUMNS[3:]}
+        rows.append(Bunch.Bunch(name=t.name, ra=t.ra, dec=t.dec,
+                                rise=hhmm(res.rise[i]), set=hhmm(res.set[i]),
+                                highest=hhmm(res.highest[i]),
+                                max_alt=num(res.max_alt[i], '.1f'),
+                                min_airmass=num(res.min_airmass[i], '.3f'),
+                                dark_hours=num(res.dark_hours[i], '.2f'),
+                                moon_sep_min=num(res.moon_sep_min[i], '.1f'),
+                                key={k: ('' if np.isnan(v) else float(v)) for k, v in key.items()}))
+    return rows
@@ -0,0 +1,59 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# worker processes for ephemeris computation; 0 or 1 computes serially
+POOL_SIZE = 0
+# target lists shorter than this are computed serially to avoid IPC costs
+POOL_MIN_TARGETS = 200
+
+_executor = None
+_lock = threading.Lock()
+
+
+def init_app(app):
+    """Read the pool settings from the application config."""
+    global POOL_SIZE, POOL_MIN_TARGETS
+
+    POOL_SIZE = app.config.get('EPHEM_POOL_SIZE', POOL_SIZE)
+    POOL_MIN_TARGETS = app.config.get('EPHEM_POOL_MIN_TARGETS', POOL_MIN_TARGETS)
+    app.logger.debug(f'ephemeris pool size={POOL_SIZE}, min targets={POOL_MIN_TARGETS}')
+
+def use_pool(num_targets):
+    return POOL_SIZE > 1 and num_targets >= POOL_MIN_TARGETS
+
+def get_executor():
+    """Return the process pool, starting it on first use."""
+    global _executor
+
+    with _lock:
+        if _executor is None:
+            # the callers are threads (WSGI workers, background jobs), and
+            # forking a multithreaded process can deadlock the child
+            _executor = ProcessPoolExecutor(max_workers=POOL_SIZE,
+                                            mp_context=multiprocessing.get_context('forkserver'))
+        return _executor
+
+def chunk_bounds(num, nchunks):
+    """Split range(num) into at most `nchunks` contiguous (start, stop) pairs."""
+    nchunks = max(1, min(nchunks, num))
+    size, extra = divmod(num, nchunks)
+    bounds = []
+    start = 0
+    for i in range(nchunks):
+        stop = start + size + (1 if i < extra else 0)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+def map_chunks(func, args):
+    """Run `func` over `args` in the pool; results come back in input order."""
+    return list(get_executor().map(func, args))
+
+def shutdown():
+    global _executor
+
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
@@ -0,0 +1,40 @@
+import bokeh
+from bokeh.resources import INLINE, CDN, Resources
+
+from flask import current_app, url_for
+
+try:
+    from bokeh.util.paths import static_path
+except ImportError:
+    # bokeh < 3.0
+    from bokeh.util.paths import bokehjsdir as static_path
+
+# BokehJS files are served under a versioned URL, so they can be cached "forever"
+BOKEH_STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+def bokeh_static_dir():
+    """Directory holding the installed BokehJS bundle (js/...)."""
+    return str(static_path())
+
+def bokeh_resources():
+    """
+    Return the (js, css) BokehJS resources for a plot page according to
+    the BOKEH_RESOURCES setting:
+
+    - inline: embed the whole bundle in every page (default)
+    - cdn: load it from cdn.bokeh.org
+    - static: load it from this app, pinned to the installed version
+    """
+    mode = current_app.config.get('BOKEH_RESOURCES', 'inline').lower()
+
+    if mode == 'static':
+        # bokeh appends 'static/js/...' to the root url; see routes.bokeh_static
+        root_url = url_for('main.index') + f'bokeh/{bokeh.__version__}/'
+        resources = Resources(mode='server', root_url=root_url)
+    elif mode == 'cdn':
+        resources = CDN
+    else:
+        resources = INLINE
+
+    return resources.render_js(), resources.render_css()
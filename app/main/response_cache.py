@@ -0,0 +1,91 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import request, make_response, g
+
+from .cache import SizedLRUCache
+from .image import IMAGE_FORMATS
+from . import metrics
+
+# total size of the cached response bodies; 0 disables the cache
+RESPONSE_CACHE_BYTES = 64 * 1024**2
+
+_cache = SizedLRUCache(maxbytes=RESPONSE_CACHE_BYTES, sizeof=lambda entry: len(entry[0]))
+
+
+def init_app(app):
+    """Read the response cache settings from the application config."""
+    global _cache
+
+    maxbytes = app.config.get('RESPONSE_CACHE_BYTES', RESPONSE_CACHE_BYTES)
+    _cache = SizedLRUCache(maxbytes=maxbytes, sizeof=lambda entry: len(entry[0]))
+    app.logger.debug(f'response cache bytes={maxbytes}')
+
+def cache_stats():
+    return _cache.stats()
+
+def request_key():
+    """
+    Hash of everything a visibility response depends on: the endpoint,
+    the normalized form or query values and the uploaded files' names
+    and bytes.
+    """
+    h = hashlib.sha256()
+    h.update(request.endpoint.encode('utf-8'))
+
+    for name in sorted(request.values.keys()):
+        for value in request.values.getlist(name):
+            h.update(f'\0{name}={value.strip()}'.encode('utf-8'))
+
+    for name in sorted(request.files.keys()):
+        for f in request.files.getlist(name):
+            h.update(f'\0{name}:{f.filename}:'.encode('utf-8'))
+            h.update(f.stream.read())
+            f.stream.seek(0)
+
+    # static images mark the current hour
+    if request.values.get('format', '').lower() in IMAGE_FORMATS:
+        h.update(datetime.now().strftime('%Y%m%d%H').encode('utf-8'))
+
+    return h.hexdigest()
+
+def cached_response(view):
+    """
+    Serve a view's successful responses from a cache keyed by
+    request_key(), with the key as ETag so that a client's
+    If-None-Match gets a 304 without even a cache lookup.  Anything
+    but a 200, e.g. an error page or a redirect to a job, is passed
+    through without caching and without an ETag, so views must return
+    their error pages with a 4xx/5xx status.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with metrics.stage('request_hash'):
+            etag = request_key()
+        # also the key of a job the view may start; see jobs.submit
+        g.request_key = etag
+
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+
+        entry = _cache.get(etag)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            entry = (response.get_data(), response.headers.get('Content-Type'),
+                     response.headers.get('Content-Disposition'))
+            _cache.put(etag, entry)
+
+        data, content_type, disposition = entry
+        response = make_response(data)
+        response.headers['Content-Type'] = content_type
+        if disposition:
+            response.headers['Content-Disposition'] = disposition
+        response.set_etag(etag)
+        return response
+
+    return wrapper
@@ -1,42 +1,106 @@
-import os
+import io
+import time
 
-import collections
-from datetime import datetime
-import operator
-
-from flask import render_template, redirect, url_for, request, current_app, session, send_from_directory
+from flask import render_template, redirect, url_for, request, current_app, send_from_directory, g
 #from flask.ext.login import login_required, login_user, logout_user
 from . import main
 #from .forms import TargetForm
-from flask import make_response
+from flask import make_response, jsonify
 from flask import current_app as app
 
-#from werkzeug import secure_filename
-from werkzeug.utils import secure_filename
+from werkzeug.datastructures import FileStorage
 
-from functools import wraps, update_wrapper
+from functools import partial
 
 from . import helper_func as helper
-from .target_plot import TargetPlot
-from .laser_plot import LaserPlot
-
-import tempfile
-
+from .resources import bokeh_resources, bokeh_static_dir, BOKEH_STATIC_MAX_AGE
+from .response_cache import cached_response
+from . import jobs
+from . import metrics
+from .logutil import summary
+from . import trajectory, almanac, response_cache
+from .base_plot import ALT_LOW, ALT_HIGH
+
+import bokeh
 from bokeh.embed import components
 #from bokeh.util.string import encode_utf8
-from bokeh.resources import INLINE
 #from bokeh.resources  import settings
 #settings.resources = 'inline'
 
-from bokeh.plotting import figure
-from bokeh.resources import CDN
-from bokeh.embed import file_html
-
 from ginga.misc import Bunch
 
-def delete_files(files):
-    for f in files:
-        os.remove(f)
+def target_job(job, read_targets, mysite, mydate, time_interval, date_end, logger):
+    """
+    Read the targets with read_targets() and compute their visibility
+    plot in the background; see jobs.submit.
+    """
+    job.progress('reading the targets')
+    with metrics.stage('parse'):
+        targets = read_targets()
+
+    fig, errors = helper.populate_visibility(target_list=targets, mysite=mysite, mydate=mydate, logger=logger,
+                                             time_interval=time_interval, date_end=date_end, progress=job.progress)
+    job.progress('serializing the plot')
+    script, div = components(fig)
+    return Bunch.Bunch(plot_script=script, plot_div=div, errors=errors)
+
+def copy_uploads(files):
+    """In-memory copies of uploaded files, which outlive the request."""
+    return [FileStorage(stream=io.BytesIO(f.read()), filename=f.filename) for f in files]
+
+def submit_target_job(read_targets, mysite, mydate):
+    """
+    Start a job for a large upload and send the client to its page
+    right away; the upload is parsed in the job by read_targets().  The
+    job is keyed by the request's hash, so that the same submission is
+    sent to the job already running or done instead of starting anew.
+    """
+    job = jobs.submit(target_job, read_targets, mysite, mydate, request.form.get('time_interval'),
+                      request.form.get('date_end'), app.logger, key=g.get('request_key'), logger=app.logger)
+    app.logger.debug('job=%s', job.id)
+    return redirect(url_for('main.job_page', job_id=job.id))
+
+def summary_page(targets, mysite, mydate):
+    """Render the observability table of `targets` instead of a plot."""
+    try:
+        rows, errors = helper.target_summary(targets, mysite, mydate, app.logger,
+                                             time_interval=request.form.get('time_interval'))
+    except Exception as e:
+        app.logger.error(f'Error: failed to summarize targets. {e}')
+        return make_response(render_template('target_visibility.html', errors=[f"Summary Error: {e}"]), 500)
+
+    with metrics.stage('render'):
+        html = render_template('summary.html', rows=rows, errors=errors, date=mydate,
+                               tz=mysite.tz_local, alt_low=ALT_LOW, alt_high=ALT_HIGH)
+    return html.encode('utf-8')
+
+@main.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@main.after_app_request
+def add_server_timing(response):
+
+    # only requests that recorded stages are reported
+    timings = g.get('timings')
+    if timings:
+        total = time.perf_counter() - g.request_start
+        metrics.request_seconds.observe((request.endpoint or 'unknown',), total)
+        response.headers['Server-Timing'] = metrics.server_timing(timings, total)
+    return response
+
+@main.route('/metrics')
+def Metrics():
+
+    # local scrapers only
+    if request.remote_addr not in metrics.METRICS_ALLOW:
+        return make_response('', 404)
+
+    caches = dict(trajectory=trajectory.cache_stats(), almanac=almanac.cache_stats(),
+                  response=response_cache.cache_stats())
+    response = make_response(metrics.expose(caches))
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
 
 @main.route('/')
 def index():
@@ -49,6 +113,57 @@ def help():
 
     return render_template('help.html')
 
+@main.route('/job/<job_id>')
+def job_page(job_id):
+
+    job = jobs.get_job(job_id)
+
+    if job is None:
+        return make_response(render_template('target_visibility.html', errors=[f'No such job. job={job_id}']), 404)
+
+    if job.state == 'failed':
+        return make_response(render_template('target_visibility.html', errors=[f"Plot Error: {e}" for e in job.errors]), 500)
+
+    if job.state != 'done':
+        return render_template('job.html', job=job)
+
+    # Grab the static resources
+    js_resources, css_resources = bokeh_resources()
+
+    html = render_template(
+        'target_visibility.html',
+        plot_script=job.result.plot_script,
+        plot_div=job.result.plot_div,
+        js_resources=js_resources,
+        css_resources=css_resources,
+        errors=job.result.errors)
+
+    html = html.encode('utf-8')
+    return html
+
+@main.route('/job/<job_id>/status')
+def job_status(job_id):
+
+    job = jobs.get_job(job_id)
+
+    if job is None:
+        return make_response(jsonify(id=job_id, state='unknown'), 404)
+
+    return jsonify(job.status())
+
+@main.route('/bokeh/<version>/static/<path:filename>')
+def bokeh_static(version, filename):
+
+    # only serve the installed version; the version in the URL is what
+    # makes the long cache lifetime safe across upgrades
+    if version != bokeh.__version__:
+        return make_response('', 404)
+
+    response = send_from_directory(bokeh_static_dir(), filename, max_age=BOKEH_STATIC_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 """
 @main.route('/ope-error/<error>')
 def opeError(error):
@@ -57,6 +172,7 @@ def opeError(error):
 """
 
 @main.route('/laser', methods=['POST'])
+@cached_response
 def Laser():
 
     errors = []
@@ -67,49 +183,47 @@ def Laser():
     file = request.files.get("laser")
     mysite = helper.site(request.form.get('site'))
 
-    app.logger.debug(f'laser file={file.filename}')
+    app.logger.debug('laser file=%s', file.filename)
 
     try:
-        data = file.readlines()
-        app.logger.debug(f'file data={data}')
         #mydate, targets, laser_safe_time = helper.get_laser_info(data, app.logger)
-        mydate, targets = helper.get_laser_info(data, app.logger)
+        with metrics.stage('parse'):
+            mydate, targets = helper.get_laser_info(file.stream, app.logger)
     except Exception as e:
         app.logger.error(f'Error: reading laser file. {e}')
         err = f'Reading laser file.  filename={file.filename}.  {e}'
         errors.append(err)
-        return render_template('laser_visibility.html', js_resources=None, css_resources=None, targets=None, errors=errors)
+        return make_response(render_template('laser_visibility.html', js_resources=None, css_resources=None, targets=None, errors=errors), 400)
 
-    plots = []
+    try:
+        laser_plots, errors = helper.populate_interactive_lasers(targets, mysite, mydate, app.logger,
+                                                                 time_interval=request.form.get('time_interval'))
+    except Exception as e:
+        app.logger.error(f'Error: failed to populate laser plots. {e}')
+        errors.append(f'Plotting laser collision. {e}')
+        return make_response(render_template('laser_visibility.html', js_resources=None, css_resources=None, targets=None, errors=errors), 500)
 
     # Grab the static resources
-    js_resources = INLINE.render_js()
-    css_resources = INLINE.render_css()
-
-    for target in sorted(targets, key = lambda i: (i.name, i.ra, i.dec)):
-
-        safe_time = target.safe_time
-        app.logger.debug(f'Target name={target.name}')
-        app.logger.debug(f'Laser safe time={safe_time}')
-
-        try:
-            fig = helper.populate_interactive_laser(target, safe_time, mysite, mydate, app.logger)
-        except Exception as e:
-            app.logger.error(f'Error: failed to populate laser plot. {e}')
-            err = f'Plotting laser collision for {target.name}. {e}'
-            errors.append(err)
-            return render_template('laser_visibility.html', js_resources=js_resources, css_resources=css_resources, targets=plots, errors=errors)
-        else:
-            script, div = components(fig)
-            plots.append(Bunch.Bunch(plot_script=script, plot_div=div, name=target.name, ra=target.ra, dec=target.dec))
+    js_resources, css_resources = bokeh_resources()
+
+    # all plots go into one Bokeh document: one script, one div per target
+    script = None
+    plots = []
+    if laser_plots:
+        with metrics.stage('components'):
+            script, divs = components([layout for _, layout in laser_plots])
+        for (target, _), div in zip(laser_plots, divs):
+            plots.append(Bunch.Bunch(plot_div=div, name=target.name, ra=target.ra, dec=target.dec))
 
     # render template
-    html = render_template('laser_visibility.html', js_resources=js_resources, css_resources=css_resources, targets=plots)
+    with metrics.stage('render'):
+        html = render_template('laser_visibility.html', js_resources=js_resources, css_resources=css_resources, plot_script=script, targets=plots, errors=errors)
     html = html.encode('utf-8')
     return html
 
 
 @main.route('/csv', methods=['POST'])
+@cached_response
 def Csv():
 
     if  not request.method in ['POST']:
@@ -118,129 +232,121 @@ def Csv():
     files = request.files.getlist("csv[]")
     header = request.form.get("header")
     radec = request.form.get("radec")
-    app.logger.debug(f'radec={radec}, files={files}, header={header}')
-
-    csvs = []
-    del_files = []
-    upload_dir = current_app.config['APP_UPLOAD']
-
-    for f in files:
-        filename = secure_filename(f.filename)
-        app.logger.debug(f'secure filename={filename}')
-
-        csv = os.path.join(upload_dir, filename)
-        app.logger.debug(f'secure csv={csv}')
-        f.save(csv)
-        del_files.append(csv)
-        csvs.append(csv)
-
-    app.logger.debug(f'csvs={csvs}')
+    app.logger.debug('radec=%s, files=%s, header=%s', radec, files, header)
 
     mysite = helper.site(request.form.get('site'))
     mydate = request.form.get('date')
 
+    if request.form.get('mode') != 'summary' and jobs.use_jobs(request.content_length):
+        return submit_target_job(partial(helper.read_csv, copy_uploads(files), header, radec, app.logger),
+                                 mysite, mydate)
+
     try:
-        targets = helper.read_csv(csvs, header, radec, app.logger)
-        delete_files(del_files)
+        # parsed straight from the uploaded streams
+        with metrics.stage('parse'):
+            targets = helper.read_csv(files, header, radec, app.logger)
     except Exception as e:
         app.logger.error(f'Error: failed to populate csv plot. {e}')
-        err_msg = f"Reading csv file. files={csvs}.  {e}"
+        err_msg = f"Reading csv file. files={[f.filename for f in files]}.  {e}"
         #errors.append(err_msg)
-        return render_template('target_visibility.html', errors=[err_msg])
+        return make_response(render_template('target_visibility.html', errors=[err_msg]), 400)
+
+    if request.form.get('mode') == 'summary':
+        return summary_page(targets, mysite, mydate)
 
     try:
-        fig, errors = helper.populate_interactive_target(target_list=targets, mysite=mysite, mydate=mydate, logger=app.logger)
+        fig, errors = helper.populate_visibility(target_list=targets, mysite=mysite, mydate=mydate, logger=app.logger,
+                                                 time_interval=request.form.get('time_interval'),
+                                                 date_end=request.form.get('date_end'))
     except Exception as e:
         app.logger.error(f'Error: failed to plot csv. {e}')
         err_msg = f"Plot Error: {e}"
-        return render_template('target_visibility.html', errors=[err_msg])
+        return make_response(render_template('target_visibility.html', errors=[err_msg]), 500)
 
     # Grab the static resources
-    js_resources = INLINE.render_js()
-    css_resources = INLINE.render_css()
+    js_resources, css_resources = bokeh_resources()
 
     # render template
-    script, div = components(fig)
-    html = render_template(
-        'target_visibility.html',
-        plot_script=script,
-        plot_div=div,
-        js_resources=js_resources,
-        css_resources=css_resources,
-        errors=errors)
+    with metrics.stage('components'):
+        script, div = components(fig)
+    with metrics.stage('render'):
+        html = render_template(
+            'target_visibility.html',
+            plot_script=script,
+            plot_div=div,
+            js_resources=js_resources,
+            css_resources=css_resources,
+            errors=errors)
 
     html = html.encode('utf-8')
     return html
 
 
 @main.route('/ope', methods=['POST'])
+@cached_response
 def Ope():
 
     if  not request.method in ['POST']:
         return redirect(url_for('main.index'))
 
     files = request.files.getlist("ope[]")
-    app.logger.debug(f'files={files}')
+    app.logger.debug('files=%s', files)
 
-    opes = []
-    del_files = []
     upload_dir = current_app.config['APP_UPLOAD']
+    mysite = helper.site(request.form.get('site'))
+    mydate = request.form.get('date')
 
-    for f in files:
-        filename = secure_filename(f.filename)
-
-        ope = os.path.join(upload_dir, filename)
-        f.save(ope)
-        del_files.append(ope)
-        if filename.lower().endswith(".ope"):
-            opes.append(ope)
-
-    app.logger.debug(f'opes={opes}')
+    if request.form.get('mode') != 'summary' and jobs.use_jobs(request.content_length):
+        return submit_target_job(partial(helper.read_ope_uploads, copy_uploads(files), upload_dir, app.logger),
+                                 mysite, mydate)
 
     try:
-        targets = helper.ope(opes, upload_dir, app.logger)
+        # upload_dir is only used if an ope *LOADs a prm file
+        with metrics.stage('parse'):
+            targets = helper.read_ope_uploads(files, upload_dir, app.logger)
     except Exception as e:
         app.logger.error(f'Error: invalid ope file. {e}')
         err_msg = f"Plot Error: {e}"
         #errors.append(err_msg)
-        delete_files(del_files)
-        return render_template('target_visibility.html', errors=[err_msg])
-
-    mysite = helper.site(request.form.get('site'))
-    mydate = request.form.get('date')
+        return make_response(render_template('target_visibility.html', errors=[err_msg]), 400)
 
     #app.logger.debug('targets={}'.format(targets))
     #app.logger.debug('filepath={}'.format(filepath))
-    app.logger.debug(f'mydate={mydate}')
+    app.logger.debug('mydate=%s', mydate)
 
-    delete_files(del_files)
+    if request.form.get('mode') == 'summary':
+        return summary_page(targets, mysite, mydate)
 
     try:
-        fig, errors = helper.populate_interactive_target(target_list=targets, mysite=mysite, mydate=mydate, logger=app.logger)
+        fig, errors = helper.populate_visibility(target_list=targets, mysite=mysite, mydate=mydate, logger=app.logger,
+                                                 time_interval=request.form.get('time_interval'),
+                                                 date_end=request.form.get('date_end'))
     except Exception as e:
         app.logger.error(f'Error: failed to populate ope plot. {e}')
         err_msg = "Plot Error: {}".format(e)
-        return render_template('target_visibility.html', errors=[err_msg])
+        return make_response(render_template('target_visibility.html', errors=[err_msg]), 500)
     else:
         # Grab the static resources
-        js_resources = INLINE.render_js()
-        css_resources = INLINE.render_css()
+        js_resources, css_resources = bokeh_resources()
 
         # render template
-        script, div = components(fig)
+        with metrics.stage('components'):
+            script, div = components(fig)
 
-        html = render_template(
-            'target_visibility.html',
-            plot_script=script,
-            plot_div=div,
-            js_resources=js_resources,
-            css_resources=css_resources,
-            errors=errors)
+        with metrics.stage('render'):
+            html = render_template(
+                'target_visibility.html',
+                plot_script=script,
+                plot_div=div,
+                js_resources=js_resources,
+                css_resources=css_resources,
+                errors=errors)
 
         html = html.encode('utf-8')
         return html
 
 @main.route('/text', methods=['POST'])
+@cached_response
 def Text():
 
     if  not request.method in ['POST']:
@@ -248,47 +354,47 @@ def Text():
 
     equinox = request.form.get('equinox')
     target = request.form.get('target').strip()
-    app.logger.debug(f'target={target}')
-    targets = helper.text_dict(target=target, equinox=equinox, logger=app.logger)
+    app.logger.debug('target=%s', summary(target))
+    with metrics.stage('parse'):
+        targets = helper.text_dict(target=target, equinox=equinox, logger=app.logger)
     mysite = helper.site(request.form.get('site'))
     mydate = request.form.get('date')
 
 
-    app.logger.debug(f'targets={targets}')
+    app.logger.debug('targets=%s', summary(targets))
 
+    if request.form.get('mode') == 'summary':
+        return summary_page(targets, mysite, mydate)
 
     try:
-        fig, errors  = helper.populate_interactive_target(target_list=targets, mysite=mysite, mydate=mydate, logger=app.logger)
+        fig, errors  = helper.populate_visibility(target_list=targets, mysite=mysite, mydate=mydate, logger=app.logger,
+                                                  time_interval=request.form.get('time_interval'),
+                                                  date_end=request.form.get('date_end'))
     except Exception as e:
         app.logger.error(f'Error: failed to populate text plot. {e}')
         err_msg = f"Plot Error: {e}"
         errors = [err_msg]
-        return render_template('target_visibility.html', errors=errors)
+        return make_response(render_template('target_visibility.html', errors=errors), 500)
     else:
         # Grab the static resources
-        js_resources = INLINE.render_js()
-        css_resources = INLINE.render_css()
-
-        #resources = INLINE.render()  # CDN.render()
+        js_resources, css_resources = bokeh_resources()
 
         # render template
-        script, div = components(fig)
-        #app.logger.debug(f'script={script}, div={div}')
-
-        plot = figure()
-        plot.scatter([1,2], [3,4])
-        #script, div = components(plot)
+        with metrics.stage('components'):
+            script, div = components(fig)
+        #app.logger.debug('script=%s, div=%s', script, div)
 
 
-        html = render_template(
-            'target_visibility.html',
-            plot_script=script,
-            plot_div=div,
-            js_resources=js_resources,
-            css_resources=css_resources,
-            errors=errors)
+        with metrics.stage('render'):
+            html = render_template(
+                'target_visibility.html',
+                plot_script=script,
+                plot_div=div,
+                js_resources=js_resources,
+                css_resources=css_resources,
+                errors=errors)
 
 
         html = html.encode('utf-8')
-        #app.logger.debug(f'html={html}')
+        #app.logger.debug('html=%s', html)
         return html
@@ -0,0 +1,91 @@
+import numpy as np
+
+# default step of the trajectory time grid, in minutes
+TIME_INTERVAL = 5
+# allowed range of a requested time step, in minutes
+MIN_TIME_INTERVAL = 1
+MAX_TIME_INTERVAL = 30
+# most points per curve sent to the browser; 0 sends every sample
+MAX_POINTS = 300
+
+
+def init_app(app):
+    """Read the sampling settings from the application config."""
+    global TIME_INTERVAL, MAX_POINTS
+
+    TIME_INTERVAL = app.config.get('TIME_INTERVAL', TIME_INTERVAL)
+    MAX_POINTS = app.config.get('PLOT_MAX_POINTS', MAX_POINTS)
+    app.logger.debug(f'time interval={TIME_INTERVAL} min, max points per curve={MAX_POINTS}')
+
+def time_interval(value=None):
+    """
+    Time step in minutes from a request value such as a form field, or
+    the configured default if `value` is empty.
+    """
+    if value is None or value == '':
+        return TIME_INTERVAL
+
+    step = float(value)
+    if not MIN_TIME_INTERVAL <= step <= MAX_TIME_INTERVAL:
+        raise ValueError(f"time step must be {MIN_TIME_INTERVAL}-{MAX_TIME_INTERVAL} minutes. time_interval={value}")
+    return step
+
+def marker_step(times, minutes=60):
+    """Number of samples of the uniform grid `times` between markers about `minutes` apart."""
+    if len(times) < 2:
+        return 1
+    step = (times[1] - times[0]).total_seconds() / 60
+    return max(1, int(round(minutes / step)))
+
+def lttb(y, threshold=None, x=None):
+    """
+    Indices of the `threshold` points of the curve (x, y) picked by
+    Largest-Triangle-Three-Buckets, which keeps the visual shape of the
+    curve: peaks and turning points survive the decimation.  `x`
+    defaults to a uniform grid.  All indices are returned if the curve
+    already has no more than `threshold` points.
+
+    `y` may also be an (N, T) array of curves sharing `x`, e.g. the
+    altitudes of all targets; they are decimated together, bucket by
+    bucket, and an (N, threshold) array of indices is returned.
+    """
+    if threshold is None:
+        threshold = MAX_POINTS
+
+    y = np.asarray(y, dtype=float)
+    curves = np.atleast_2d(y)
+    num_curves, num = curves.shape
+    if threshold < 3 or num <= threshold:
+        indices = np.broadcast_to(np.arange(num), (num_curves, num))
+        return indices if y.ndim > 1 else indices[0]
+
+    x = np.arange(num, dtype=float) if x is None else np.asarray(x, dtype=float)
+
+    # the first and last points are kept, the others split into buckets
+    edges = np.linspace(1, num - 1, threshold - 1).astype(int)
+    counts = np.diff(edges)
+    # bucket averages: the third vertex of the previous bucket's
+    # triangles, followed by the last point for the last bucket
+    cx = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])
+    cy = np.column_stack([np.add.reduceat(curves[:, :-1], edges[:-1], axis=1) / counts, curves[:, -1]])
+
+    indices = np.empty((num_curves, threshold), dtype=int)
+    indices[:, 0] = 0
+    indices[:, -1] = num - 1
+
+    rows = np.arange(num_curves)
+    a = np.zeros(num_curves, dtype=int)
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        xa, ya = x[a][:, None], curves[rows, a][:, None]
+
+        area = np.abs((xa - cx[i + 1]) * (curves[:, lo:hi] - ya) - (xa - x[lo:hi]) * (cy[:, i + 1, None] - ya))
+        a = lo + np.argmax(area, axis=1)
+        indices[:, i + 1] = a
+
+    return indices if y.ndim > 1 else indices[0]
+
+def decimate(times, values, threshold=None):
+    """Return (times, values) of the curve reduced to at most `threshold` points."""
+    keep = lttb(values, threshold)
+    return ([times[i] for i in keep], np.asarray(values)[keep])
@@ -18,32 +18,68 @@ from bokeh.models import Toggle, CustomJS
 from bokeh.layouts import layout, row, column
 from bokeh.models.widgets import CheckboxGroup
 from bokeh.models import Span
+from bokeh.models import ColumnDataSource, CDSView, BooleanFilter, TapTool
 from bokeh.core.properties import String
+from bokeh.util.serialization import convert_datetime_type
 
 try:
     from .base_plot import BasePlot
+    from . import sampling
 except:
     from base_plot import BasePlot
+    import sampling
 
 from ginga.misc import Bunch
-import matplotlib.dates as mpl_dt
+
+# from this many targets on, all trajectories are drawn from one data source
+SINGLE_SOURCE_MIN_TARGETS = 50
+# from this many targets on, the plot is rendered with WebGL
+WEBGL_MIN_TARGETS = 100
+
+
+def init_app(app):
+    """Read the plot settings from the application config."""
+    global SINGLE_SOURCE_MIN_TARGETS, WEBGL_MIN_TARGETS
+
+    SINGLE_SOURCE_MIN_TARGETS = app.config.get('PLOT_SINGLE_SOURCE_MIN_TARGETS', SINGLE_SOURCE_MIN_TARGETS)
+    WEBGL_MIN_TARGETS = app.config.get('PLOT_WEBGL_MIN_TARGETS', WEBGL_MIN_TARGETS)
+    app.logger.debug('single source plot min targets=%s, webgl min targets=%s', SINGLE_SOURCE_MIN_TARGETS, WEBGL_MIN_TARGETS)
 
 
 class TargetPlot(BasePlot):
     """
     Plot target visibility and trajectories (including Moon trajectory/distance)
-    for given targets at a specific site.
+    for given targets in an observing context.
     """
 
     def __init__(self, logger=None, **kwargs):
         super().__init__(logger, **kwargs)
-
-    def plot_target(self, site, tgt_data):
+        self.toggles = []
+
+    def plot_target(self, ctx, tgt_data, single_source=None, webgl=None):
+        """
+        Draw the targets in `tgt_data`.  With `single_source` (by default for
+        long target lists) all targets share one multi_line renderer and
+        are hidden through the checkboxes in self.toggles.  With `webgl`
+        (by default for even longer lists) the plot is rendered with WebGL.
+        """
         self.logger.debug("Plotting targets...")
-        self.plot_base(site)
 
-        self.target_trajectory(tgt_data, site)
-        self.moon_trajectory(tgt_data, site)
+        if webgl is None:
+            webgl = len(tgt_data) >= WEBGL_MIN_TARGETS
+        if webgl:
+            self.fig.output_backend = "webgl"
+
+        self.plot_base(ctx)
+
+        if single_source is None:
+            single_source = len(tgt_data) >= SINGLE_SOURCE_MIN_TARGETS
+
+        if single_source:
+            self.target_trajectory_single_source(tgt_data, ctx)
+        else:
+            self.target_trajectory(tgt_data, ctx)
+        self.moon_trajectory(tgt_data, ctx)
 
         self.fig.legend.click_policy = "hide"
         self.logger.debug("plot_target done.")
@@ -51,16 +87,15 @@ class TargetPlot(BasePlot):
     # ---------------------------
     # Moon trajectory
     # ---------------------------
-    def moon_trajectory(self, tgt_data, site):
+    def moon_trajectory(self, tgt_data, ctx):
         moon_data = tgt_data[0].tgt_calc.moon_alt
-        moon_lt_data = [dt.astimezone(site.tz_local) for dt in tgt_data[0].tgt_calc.lt]
+        moon_lt_data = [dt.astimezone(ctx.tz) for dt in tgt_data[0].tgt_calc.lt]
 
         illum_time = moon_lt_data[moon_data.argmax()]
-        moon_illum = site.moon_phase(date=illum_time)
+        moon_illum = ctx.site.moon_phase(date=illum_time)
 
-        moon = self.fig.line(
-            moon_lt_data,
-            moon_data,
+        moon = self._line(
+            *sampling.decimate(moon_lt_data, moon_data),
             line_color="orange",
             line_alpha=0.5,
             line_dash="dashed",
@@ -79,7 +114,7 @@ class TargetPlot(BasePlot):
     # Moon distance annotations
     # ---------------------------
     def moon_distance(self, moon_sep, lt_data, alt_data, color):
-        min_interval = 12  # every ~1 hr (5 min steps assumed)
+        min_interval = sampling.marker_step(lt_data)  # every ~1 hr
         mt = lt_data[0:-1:min_interval]
         moon_sep = moon_sep[0:-1:min_interval]
         alt_interval = alt_data[0:-1:min_interval]
@@ -99,17 +134,22 @@ class TargetPlot(BasePlot):
     # ---------------------------
     # Target trajectories
     # ---------------------------
-    def target_trajectory(self, tgt_data, site):
+    def target_trajectory(self, tgt_data, ctx):
         legend_items = []
 
-        for  target in sorted(tgt_data, key=lambda k: k.tgt_info.name, reverse=False):
+        targets = sorted(tgt_data, key=lambda k: k.tgt_info.name, reverse=False)
+        # the curves share the time grid: decimate them all at once
+        keep = sampling.lttb(np.array([t.tgt_calc.alt_deg for t in targets]))
+
+        for target, target_keep in zip(targets, keep):
         #for target in sorted(tgt_data, key=lambda t: t.name):
-            lt_data = [dt.astimezone(site.tz_local) for dt in target.tgt_calc.lt]
+            lt_data = [dt.astimezone(ctx.tz) for dt in target.tgt_calc.lt]
             alt_data = target.tgt_calc.alt_deg
             moon_sep = target.tgt_calc.moon_sep
 
             color = f"#{random.randint(0, 0xFFFFFF):06x}"
-            target_line = self.fig.line(lt_data, alt_data, line_color=color, line_width=3)
+            target_line = self.fig.line([lt_data[i] for i in target_keep], np.asarray(alt_data)[target_keep],
+                                        line_color=color, line_width=3)
 
             # Label at maximum altitude
             x = lt_data[np.argmax(alt_data)]
@@ -147,6 +187,96 @@ class TargetPlot(BasePlot):
             "right"
         )
 
+    def target_trajectory_single_source(self, tgt_data, ctx):
+        """
+        Draw all trajectories and name labels from one ColumnDataSource and
+        all moon distance markers from another.  Clicking a trajectory
+        highlights it; the checkboxes hide targets by filtering both sources.
+        """
+        targets = sorted(tgt_data, key=lambda k: k.tgt_info.name, reverse=False)
+        num = len(targets)
+
+        # the targets share the time grid; as Bokeh does for datetimes, plot the local wall-clock time
+        x = np.array([convert_datetime_type(dt.astimezone(ctx.tz)) for dt in targets[0].tgt_calc.lt])
+        alt = np.array([t.tgt_calc.alt_deg for t in targets])
+        moon_sep = np.array([t.tgt_calc.moon_sep for t in targets])
+
+        labels = [f"{t.tgt_info.name} {t.tgt_info.ra} {t.tgt_info.dec}" for t in targets]
+        colors = [f"#{random.randint(0, 0xFFFFFF):06x}" for _ in targets]
+
+        # label at maximum altitude
+        peak = np.argmax(alt, axis=1)
+        keep = sampling.lttb(alt)
+        source = ColumnDataSource(data=dict(
+            xs=list(x[keep]),
+            ys=list(np.take_along_axis(alt, keep, axis=1)),
+            name=[t.tgt_info.name for t in targets],
+            color=colors,
+            label_x=x[peak],
+            label_y=alt[np.arange(num), peak] + 1,
+        ))
+
+        # moon distance every ~1 hr, where the target is up
+        idx = np.arange(0, len(x) - 1, sampling.marker_step(targets[0].tgt_calc.lt))
+        tgt, col = np.nonzero(alt[:, idx] >= 0)
+        markers = ColumnDataSource(data=dict(
+            x=x[idx][col],
+            y=alt[:, idx][tgt, col],
+            text=[f"{v:.1f}" for v in moon_sep[:, idx][tgt, col]],
+            color=[colors[i] for i in tgt],
+            tgt=tgt,
+        ))
+
+        target_view = CDSView(filter=BooleanFilter(booleans=[True] * num))
+        marker_view = CDSView(filter=BooleanFilter(booleans=[True] * len(tgt)))
+
+        lines = self.fig.multi_line('xs', 'ys', source=source, view=target_view,
+                                    line_color='color', line_width=3,
+                                    selection_line_width=5, nonselection_line_alpha=0.2)
+        self.fig.text('label_x', 'label_y', text='name', source=source, view=target_view,
+                      text_color='color', text_align="center", text_baseline="bottom",
+                      nonselection_text_alpha=0.2)
+        self.fig.scatter('x', 'y', source=markers, view=marker_view,
+                         color='color', size=10, fill_alpha=0.8, nonselection_fill_alpha=0.2)
+        self.fig.text('x', 'y', text='text', source=markers, view=marker_view,
+                      text_font_size="9pt", text_align="center", text_baseline="bottom")
+
+        # highlight: select the clicked targets' markers with them
+        self.fig.add_tools(TapTool(renderers=[lines]))
+        source.selected.js_on_change('indices', CustomJS(args=dict(markers=markers), code='''
+            const selected = new Set(cb_obj.indices)
+            const tgt = markers.data.tgt
+            const indices = []
+            for (let i = 0; i < tgt.length; i++) {
+                if (selected.has(tgt[i]))
+                    indices.push(i)
+            }
+            markers.selected.indices = indices
+        '''))
+
+        # hide: filter the unchecked targets out of both sources
+        checkbox = CheckboxGroup(labels=labels, active=list(range(num)))
+        checkbox.js_on_change('active', CustomJS(args=dict(target_view=target_view, marker_view=marker_view, markers=markers), code='''
+            const shown = new Set(cb_obj.active)
+            const tgt = markers.data.tgt
+            target_view.filter.booleans = target_view.filter.booleans.map((_, i) => shown.has(i))
+            marker_view.filter.booleans = Array.from(tgt, (t) => shown.has(t))
+        '''))
+        self.toggles.append(checkbox)
+
+        legend_title = LegendItem(
+            label="Targets are listed on the right (Moon distance in shown as circles)",
+            renderers=[]
+        )
+
+        self.fig.add_layout(
+            Legend(items=[legend_title],
+                   location="top_right",
+                   background_fill_color="white",
+                   background_fill_alpha=0.7),
+            "right"
+        )
+
 
 
 if __name__ == '__main__':
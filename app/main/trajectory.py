@@ -0,0 +1,352 @@
+from datetime import timedelta
+
+import numpy as np
+
+from skyfield.api import Star
+from astropy.coordinates import SkyCoord, FK5
+from astropy.time import Time
+import astropy.units as u
+
+from qplan.util.calcpos import alt2airmass
+from ginga.misc import Bunch
+
+try:
+    from .cache import SizedLRUCache
+    from .context import observing_context
+    from . import pool
+    from . import ephemeris
+except:
+    from cache import SizedLRUCache
+    from context import observing_context
+    import pool
+    import ephemeris
+
+# memory budget for memoized trajectories
+TRAJECTORY_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def sexagesimal_to_deg(values, hours=False):
+    """
+    Convert a sequence of 'dd:mm:ss.s' strings to an array of degrees.
+    If `hours` is True, the values are taken to be 'hh:mm:ss.s'.
+    """
+    deg = np.empty(len(values), dtype=float)
+    for i, val in enumerate(values):
+        val = val.strip()
+        sign = -1.0 if val.startswith('-') else 1.0
+        d, m, s = (abs(float(v)) for v in val.split(':'))
+        deg[i] = sign * (d + m / 60.0 + s / 3600.0)
+
+    if hours:
+        deg *= 15.0
+    return deg
+
+def to_icrs(ra_deg, dec_deg, equinox):
+    """
+    Precess coordinates given at `equinox` (array of years) to ICRS.
+    J2000 coordinates are passed through untouched.
+    """
+    ra_deg = np.array(ra_deg, dtype=float)
+    dec_deg = np.array(dec_deg, dtype=float)
+    equinox = np.asarray(equinox, dtype=float)
+
+    for eq in np.unique(equinox):
+        if np.isclose(eq, 2000.0):
+            continue
+        idx = equinox == eq
+        c = SkyCoord(ra=ra_deg[idx]*u.deg, dec=dec_deg[idx]*u.deg,
+                     frame=FK5(equinox=Time(eq, format='jyear')))
+        c = c.transform_to('icrs')
+        ra_deg[idx] = c.ra.deg
+        dec_deg[idx] = c.dec.deg
+
+    return ra_deg, dec_deg
+
+def unit_vectors(ra_deg, dec_deg):
+    """Return (N, 3) cartesian unit vectors for equatorial coordinates."""
+    ra = np.radians(ra_deg)
+    dec = np.radians(dec_deg)
+    cos_dec = np.cos(dec)
+    return np.stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)], axis=-1)
+
+def horizon_vectors(alt, az):
+    """Return (..., 3) (north, east, up) unit vectors for skyfield alt/az angles."""
+    alt = alt.radians
+    az = az.radians
+    cos_alt = np.cos(alt)
+    return np.stack([cos_alt * np.cos(az), cos_alt * np.sin(az), np.sin(alt)], axis=-1)
+
+def time_grid(ctx, time_start=None, time_stop=None, time_interval=5):
+    """
+    Build the night's time grid, from sunset (or `time_start`) to sunrise
+    (or `time_stop`) every `time_interval` minutes.
+    """
+    if time_start is None:
+        time_start = ctx.site.sunset(ctx.date)
+    if time_stop is None:
+        time_stop = ctx.site.sunrise(time_start)
+
+    step = timedelta(minutes=time_interval)
+    num = int((time_stop - time_start) / step) + 1
+    return [time_start + i * step for i in range(num)]
+
+
+def horizon_frame(observer):
+    """
+    Sample the site's horizon frame at the times of `observer` (the
+    site's skyfield position at T times).  Returns a Bunch of basis, the
+    images of the ICRS x, y and z axes in the local (north, east, up)
+    frame as (T, 3, 3), and moon_vec (T, 3) and moon_alt (T,) of the moon.
+    """
+    basis = []
+    for ra_hours, dec_degrees in [(0.0, 0.0), (6.0, 0.0), (0.0, 90.0)]:
+        axis = Star(ra_hours=ra_hours, dec_degrees=dec_degrees)
+        alt, az, _ = observer.observe(axis).apparent().altaz()
+        basis.append(horizon_vectors(alt, az))
+    basis = np.stack(basis, axis=-1)  # (T, 3, 3)
+
+    alt, az, _ = observer.observe(ephemeris.body('moon')).apparent().altaz()
+    return Bunch.Bunch(basis=basis, moon_vec=horizon_vectors(alt, az), moon_alt=alt.degrees)
+
+def target_vectors(targets):
+    """ICRS unit vectors (N, 3) of `targets` (ra/dec in sexagesimal, with equinox)."""
+    ra_deg = sexagesimal_to_deg([tgt.ra for tgt in targets], hours=True)
+    dec_deg = sexagesimal_to_deg([tgt.dec for tgt in targets])
+    equinox = [float(tgt.equinox) for tgt in targets]
+    return unit_vectors(*to_icrs(ra_deg, dec_deg, equinox))
+
+def to_local(basis, vectors):
+    """Rotate ICRS unit `vectors` (N, 3) into the horizon frames `basis` (T, 3, 3): (N, T, 3)."""
+    local = np.einsum('tij,nj->nti', basis, vectors)
+    local /= np.linalg.norm(local, axis=-1, keepdims=True)
+    return local
+
+
+class TrajectoryBatch:
+    """
+    Altitude, azimuth, airmass and moon separation of N targets over a
+    common time grid of T samples, as (N, T) arrays.
+    """
+    def __init__(self, names, ut, lt, alt_deg, az_deg, airmass, moon_sep, moon_alt):
+        self.names = names
+        self.ut = ut
+        self.lt = lt
+        self.alt_deg = alt_deg
+        self.az_deg = az_deg
+        self.airmass = airmass
+        self.moon_sep = moon_sep
+        self.moon_alt = moon_alt
+
+    def __len__(self):
+        return len(self.names)
+
+    def target_calc(self, i):
+        """
+        Return the i-th target's trajectory in the shape returned by
+        qplan's get_target_info, so the plot classes can use it as is.
+        """
+        return Bunch.Bunch(ut=self.ut, lt=self.lt,
+                           alt_deg=self.alt_deg[i], az_deg=self.az_deg[i],
+                           airmass=self.airmass[i], moon_sep=self.moon_sep[i],
+                           moon_alt=self.moon_alt)
+
+
+def _night(ctx, time_start=None, time_stop=None):
+    """The part of the cache keys that names the night (or time range) of `ctx`."""
+    if time_start is None and time_stop is None:
+        return ctx.date.astimezone(ctx.tz).date()
+    return (time_start, time_stop)
+
+def night_frame(ctx, time_start=None, time_stop=None, time_interval=5):
+    """
+    The night's time grid (ut, lt) with the horizon frame and the moon's
+    track over it (see horizon_frame), computed once per (site, night,
+    time step) and shared by every target and request of that night.
+    """
+    key = ('frame', ctx.name, _night(ctx, time_start, time_stop), time_interval)
+    frame = _cache.get(key)
+    if frame is None:
+        dts = time_grid(ctx, time_start=time_start, time_stop=time_stop,
+                        time_interval=time_interval)
+        observer = ephemeris.observer(ctx.site, dts)
+
+        frame = horizon_frame(observer)
+        frame.ut = list(observer.t.utc_datetime())
+        frame.lt = [dt.astimezone(ctx.tz) for dt in frame.ut]
+        _cache.put(key, frame)
+    return frame
+
+def rotate_targets(basis, moon_vec, targets):
+    """
+    Altitude, azimuth, airmass and moon separation (N, T) of `targets`
+    in the horizon frames `basis`; the moon separation is the angle to
+    the shared moon track `moon_vec`.
+    """
+    local = to_local(basis, target_vectors(targets))  # (N, T, 3)
+
+    alt_deg = np.degrees(np.arcsin(np.clip(local[..., 2], -1.0, 1.0)))
+    az_deg = np.degrees(np.arctan2(local[..., 1], local[..., 0])) % 360.0
+    moon_sep = np.degrees(np.arccos(np.clip(np.einsum('nti,ti->nt', local, moon_vec), -1.0, 1.0)))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        airmass = np.where(alt_deg > 0, alt2airmass(np.clip(alt_deg, 0.1, 90.0)), np.nan)
+
+    return (alt_deg, az_deg, airmass, moon_sep)
+
+def compute_trajectories(ctx, targets, time_start=None, time_stop=None,
+                         time_interval=5, logger=None, parallel=True):
+    """
+    Compute trajectories of all `targets` (objects with name, ra, dec and
+    equinox; ra/dec in sexagesimal) in one vectorized pass.
+
+    The site's horizon frame is sampled once per time step by observing
+    the three ICRS axes; every target is then rotated into it with a
+    single matrix product, instead of running the full apparent-place
+    computation per target.  Apart from differential aberration (< 21
+    arcsec) this matches observing each target individually; see
+    benchmarks/parity.py for the comparison with get_target_info.  The frame
+    and the moon's track come from night_frame, so they are computed
+    once per night, not per target or per request.
+
+    Long target lists are split across the worker pool, if one is
+    configured, unless `parallel` is False.
+    """
+    frame = night_frame(ctx, time_start=time_start, time_stop=time_stop,
+                        time_interval=time_interval)
+
+    if parallel and pool.use_pool(len(targets)):
+        alt_deg, az_deg, airmass, moon_sep = _compute_parallel(frame, targets, logger)
+    else:
+        alt_deg, az_deg, airmass, moon_sep = rotate_targets(frame.basis, frame.moon_vec, targets)
+
+    if logger is not None:
+        logger.debug('computed trajectories. targets=%s, samples=%s', len(targets), len(frame.ut))
+
+    names = [tgt.name for tgt in targets]
+    return TrajectoryBatch(names, frame.ut, frame.lt, alt_deg, az_deg, airmass, moon_sep, frame.moon_alt)
+
+
+def _compute_chunk(args):
+    """Pool worker: rotate one chunk of targets into the frame computed by the parent."""
+    basis, moon_vec, targets = args
+    targets = [Bunch.Bunch(name=name, ra=ra, dec=dec, equinox=equinox)
+               for name, ra, dec, equinox in targets]
+    return rotate_targets(basis, moon_vec, targets)
+
+def _compute_parallel(frame, targets, logger):
+    """Split `targets` into chunks, compute them in the pool and merge in order."""
+    items = [(tgt.name, tgt.ra, tgt.dec, float(tgt.equinox)) for tgt in targets]
+    args = [(frame.basis, frame.moon_vec, items[start:stop])
+            for start, stop in pool.chunk_bounds(len(items), pool.POOL_SIZE)]
+
+    if logger is not None:
+        logger.debug('computing %s trajectories in %s chunks', len(items), len(args))
+
+    results = pool.map_chunks(_compute_chunk, args)
+
+    return tuple(np.concatenate([res[k] for res in results]) for k in range(4))
+
+
+def _nbytes(entry):
+    """Approximate memory held by a cached trajectory or night frame."""
+    size = 0
+    for value in entry.values():
+        if isinstance(value, np.ndarray):
+            size += value.nbytes
+        elif isinstance(value, list):
+            # datetimes, ~48 bytes apiece plus the list slot
+            size += 56 * len(value)
+    return size
+
+_cache = SizedLRUCache(maxbytes=TRAJECTORY_CACHE_BYTES, sizeof=_nbytes)
+
+
+def cache_stats():
+    """Return hit/miss counters and the size of the trajectory cache."""
+    return _cache.stats()
+
+def cached_trajectories(ctx, targets, time_start=None, time_stop=None,
+                        time_interval=5, logger=None):
+    """
+    Like compute_trajectories, but each target's trajectory is memoized by
+    (ra, dec, equinox, site, night, time step), so only targets not seen
+    before for this night are computed.
+    """
+    night = _night(ctx, time_start, time_stop)
+    keys = [(tgt.ra, tgt.dec, float(tgt.equinox), ctx.name, night, time_interval)
+            for tgt in targets]
+
+    frame = night_frame(ctx, time_start=time_start, time_stop=time_stop,
+                        time_interval=time_interval)
+    rows = [_cache.get(key) for key in keys]
+    missing = [i for i, row in enumerate(rows) if row is None]
+
+    if missing:
+        batch = compute_trajectories(ctx, [targets[i] for i in missing],
+                                     time_start=time_start, time_stop=time_stop,
+                                     time_interval=time_interval, logger=logger)
+
+        for j, i in enumerate(missing):
+            rows[i] = Bunch.Bunch(alt_deg=batch.alt_deg[j], az_deg=batch.az_deg[j],
+                                  airmass=batch.airmass[j], moon_sep=batch.moon_sep[j])
+            _cache.put(keys[i], rows[i])
+
+    if logger is not None:
+        logger.debug('trajectory cache: computed=%s, reused=%s, stats=%s', len(missing), len(targets) - len(missing), cache_stats())
+
+    num = len(frame.ut)
+
+    def stack(attr):
+        if not rows:
+            return np.empty((0, num))
+        return np.vstack([row[attr] for row in rows])
+
+    names = [tgt.name for tgt in targets]
+    return TrajectoryBatch(names, frame.ut, frame.lt, stack('alt_deg'), stack('az_deg'),
+                           stack('airmass'), stack('moon_sep'), frame.moon_alt)
+
+
+if __name__ == '__main__':
+    # Benchmark: batch engine vs. per-target get_target_info
+    import time
+    import logging
+    from qplan.util.site import get_site
+    from qplan.entity import StaticTarget
+
+    logger = logging.getLogger()
+
+    site = get_site('subaru')
+    ctx = observing_context(site, '2019-06-28')
+    # get_target_info still takes its date from the site
+    site.set_date(ctx.date)
+
+    rng = np.random.default_rng(0)
+
+    def sexagesimal(val):
+        m, s = divmod(abs(val) * 3600.0, 60.0)
+        d, m = divmod(m, 60.0)
+        return f'{int(d):02d}:{int(m):02d}:{s:05.2f}'
+
+    def make_targets(num):
+        ra = rng.uniform(0.0, 24.0, num)
+        dec = rng.uniform(-30.0, 89.0, num)
+        return [Bunch.Bunch(name=f'T{i}', ra=sexagesimal(r),
+                            dec=('-' if d < 0 else '+') + sexagesimal(d), equinox=2000.0)
+                for i, (r, d) in enumerate(zip(ra, dec))]
+
+    print(f"{'targets':>8} {'batch(s)':>10} {'loop(s)':>10}")
+    for num in [10, 100, 1000, 10000]:
+        targets = make_targets(num)
+
+        start = time.perf_counter()
+        compute_trajectories(ctx, targets)
+        batch_time = time.perf_counter() - start
+
+        loop_time = float('nan')
+        if num <= 100:
+            start = time.perf_counter()
+            for tgt in targets:
+                site.get_target_info(StaticTarget(name=tgt.name, ra=tgt.ra, dec=tgt.dec, equinox=tgt.equinox))
+            loop_time = time.perf_counter() - start
+
+        print(f'{num:>8} {batch_time:>10.3f} {loop_time:>10.3f}')
@@ -0,0 +1,55 @@
+import gc
+import time
+import importlib
+from datetime import datetime
+
+from ginga.misc import Bunch
+
+# Load everything a request may need once, in the master process of a
+# preforking WSGI server (e.g. gunicorn --preload), so that the workers
+# forked from it share these pages copy-on-write instead of paying the
+# imports and the ephemeris loading on their first requests.
+
+# imported lazily by the routes that use them
+LAZY_MODULES = ['pandas',
+                'oscript.parse.ope',
+                'matplotlib.backends.backend_agg',
+                '.laser_plot',
+                '.airmass2']
+
+
+def warmup(logger, site=None):
+    """
+    Import the lazily imported modules and compute tonight's almanac and
+    one trajectory, which loads the timescale and the ephemerides.
+    Must run before the workers fork, and before any thread or process
+    pool is started.
+    """
+    from qplan.util.site import site_subaru
+
+    from . import trajectory, ephemeris
+    from .almanac import night_almanac
+    from .context import observing_context
+
+    start = time.perf_counter()
+
+    for name in LAZY_MODULES:
+        try:
+            importlib.import_module(name, __package__)
+        except ImportError as e:
+            logger.warning(f'warmup: cannot import {name}. {e}')
+
+    site = site_subaru if site is None else site
+    ctx = observing_context(site, datetime.now(site.tz_local).strftime('%Y-%m-%d'))
+    target = Bunch.Bunch(name='warmup', ra='00:00:00.000', dec='+00:00:00.00', equinox=2000.0)
+
+    ephemeris.load_all(site, logger)
+    night_almanac(ctx, logger)
+    trajectory.compute_trajectories(ctx, [target], logger=logger, parallel=False)
+
+    # keep the garbage collector from touching (and so copying) the
+    # objects loaded so far in every worker
+    gc.collect()
+    gc.freeze()
+
+    logger.info(f'warmup done in {time.perf_counter() - start:.2f}s')
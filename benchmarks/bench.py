@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Time the stages of building a visibility page on synthetic inputs of
+increasing size, and store the results as JSON so that runs of
+different versions can be compared:
+
+    python benchmarks/bench.py -o before.json
+    python benchmarks/bench.py -o after.json --compare before.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import bokeh
+from bokeh.embed import components
+
+from app.main import helper_func as helper
+from app.main import trajectory
+from app.main.context import observing_context
+from app.main.target_plot import TargetPlot
+
+import fixtures
+
+SIZES = [1, 10, 100, 1000, 10000]
+
+
+def timeit(func, repeat):
+    """Run func() `repeat` times; returns (the last result, the times in seconds)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func()
+        times.append(time.perf_counter() - start)
+    return res, times
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+def run(options, logger):
+
+    mysite = helper.site(options.site)
+    ctx = observing_context(mysite, options.date)
+
+    fig_args = {"x_axis_type": "datetime", "title": "benchmark",
+                "tools": "pan,wheel_zoom,box_zoom,reset,save", "toolbar_location": 'above',
+                "height": 1230, "width": 1580}
+
+    results = []
+
+    def record(stage, num, times):
+        res = dict(stage=stage, targets=num, repeat=len(times),
+                   min=min(times), median=statistics.median(times), times=times)
+        results.append(res)
+        print(f"{stage:>32} {num:>7} {res['min']:>10.4f} {res['median']:>10.4f}", flush=True)
+
+    print(f"{'stage':>32} {'targets':>7} {'min(s)':>10} {'median(s)':>10}")
+
+    for num in options.sizes:
+        text = fixtures.text_targets(num)
+        csv = fixtures.csv_targets(num)
+        ope = fixtures.ope_targets(num)
+        laser = fixtures.laser_targets(num, date=options.date)
+
+        targets, times = timeit(lambda: helper.text_dict(target=text, equinox='2000.0', logger=logger), options.repeat)
+        record('text_dict', num, times)
+
+        _, times = timeit(lambda: helper.read_csv([io.BytesIO(csv)], '1', 'hms', logger), options.repeat)
+        record('read_csv', num, times)
+
+        _, times = timeit(lambda: helper.ope([('bench.ope', ope)], None, logger), options.repeat)
+        record('ope', num, times)
+
+        _, times = timeit(lambda: helper.get_laser_info(io.BytesIO(laser), logger), options.repeat)
+        record('get_laser_info', num, times)
+
+        if num > options.max_plot:
+            continue
+
+        def populate():
+            # cold: nothing memoized from the previous round
+            trajectory._cache.clear()
+            return helper.populate_interactive_target(targets, mysite, options.date, logger)
+
+        (fig, _), times = timeit(populate, options.repeat)
+        record('populate_interactive_target', num, times)
+
+        _, times = timeit(lambda: helper.populate_interactive_target(targets, mysite, options.date, logger),
+                          options.repeat)
+        record('populate_interactive_target_cached', num, times)
+
+        _, times = timeit(lambda: TargetPlot(logger, **fig_args).plot_base(ctx), options.repeat)
+        record('plot_base', num, times)
+
+        _, times = timeit(lambda: components(fig), options.repeat)
+        record('components', num, times)
+
+    meta = dict(version=git_version(), date=datetime.now(timezone.utc).isoformat(),
+                python=platform.python_version(), numpy=np.__version__, bokeh=bokeh.__version__,
+                machine=platform.machine(), node=platform.node(),
+                site=options.site, obsdate=options.date, repeat=options.repeat)
+
+    return dict(meta=meta, results=results)
+
+def compare(report, baseline):
+    """Print the ratio of each stage's best time to the baseline's."""
+    base = {(r['stage'], r['targets']): r['min'] for r in baseline['results']}
+
+    print(f"\ncompared to {baseline['meta'].get('version', '?')}")
+    print(f"{'stage':>32} {'targets':>7} {'base(s)':>10} {'now(s)':>10} {'ratio':>7}")
+    for r in report['results']:
+        key = (r['stage'], r['targets'])
+        if key in base:
+            print(f"{r['stage']:>32} {r['targets']:>7} {base[key]:>10.4f} {r['min']:>10.4f} {r['min'] / base[key]:>7.2f}")
+
+def main(options, args):
+
+    logger = logging.getLogger('bench')
+    logger.setLevel(options.loglevel)
+
+    report = run(options, logger)
+
+    if options.output:
+        with open(options.output, 'w') as out_f:
+            json.dump(report, out_f, indent=1)
+        print(f'results written to {options.output}')
+
+    if options.compare:
+        with open(options.compare, 'r') as in_f:
+            compare(report, json.load(in_f))
+
+
+if __name__ == '__main__':
+
+    argprs = ArgumentParser(description="tgtvis benchmarks")
+
+    argprs.add_argument("--sizes", dest="sizes", default=SIZES,
+                        type=lambda s: [int(n) for n in s.split(',')],
+                        help="comma separated target counts (default %(default)s)")
+    argprs.add_argument("--repeat", dest="repeat", default=3, type=int,
+                        help="runs per stage (default %(default)s)")
+    argprs.add_argument("--max-plot", dest="max_plot", default=max(SIZES), type=int,
+                        help="skip the plot stages above this many targets")
+    argprs.add_argument("--site", dest="site", default="subaru",
+                        help="site (default %(default)s)")
+    argprs.add_argument("--date", dest="date", default="2019-06-28",
+                        help="observing date (default %(default)s)")
+    argprs.add_argument("-o", "--output", dest="output", default=None, metavar="FILE",
+                        help="write the results as JSON to FILE")
+    argprs.add_argument("--compare", dest="compare", default=None, metavar="FILE",
+                        help="compare with the results in FILE")
+    argprs.add_argument("--loglevel", dest="loglevel", default=logging.WARNING, type=int,
+                        help="log level of the benchmarked code (default %(default)s)")
+
+    (options, args) = argprs.parse_known_args(sys.argv[1:])
+
+    main(options, args)
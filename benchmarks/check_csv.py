@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Check that helper_func.read_csv reports rows with an empty ra or dec
+cell as errors, with a readable message and the raw coordinates, and
+keeps every row in file order.  Exits with 1 if any check fails.
+
+    python benchmarks/check_csv.py
+"""
+import io
+import os
+import sys
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import helper_func as helper
+
+# (label, radec unit, csv text with a header)
+CASES = [('sexagesimal', 'HOUR', 'name,ra,dec,equinox\n'
+                                 'A,12:34:56.7,+10:10:10.1,2000\n'
+                                 'B,,+10:10:10.1,2000\n'
+                                 'C,12:34:56.7,,2000\n'
+                                 'D,01:02:03.4,-05:06:07.8,2000\n'),
+         ('numeric', 'HOUR', 'name,ra,dec,equinox\n'
+                             'A,123456.7,101010.1,2000\n'
+                             'B,,101010.1,2000\n'
+                             'C,123456.7,,2000\n'
+                             'D,010203.4,-050607.8,2000\n'),
+         ('degrees', 'DEG', 'name,ra,dec,equinox\n'
+                            'A,188.7363,10.1695,2000\n'
+                            'B,,10.1695,2000\n'
+                            'C,188.7363,,2000\n'
+                            'D,15.5142,-5.1022,2000\n')]
+
+
+def main():
+
+    logger = logging.getLogger('check_csv')
+    failures = []
+
+    def check(label, ok):
+        print(f'{label:>36}: {"ok" if ok else "FAIL"}')
+        if not ok:
+            failures.append(label)
+
+    for label, unit, text in CASES:
+        upload = io.BytesIO(text.encode('utf-8'))
+        upload.name = f'{label}.csv'
+        targets = helper.read_csv([upload], 'on', unit, logger)
+
+        check(f'{label}: rows in file order', [t.name for t in targets] == ['A', 'B', 'C', 'D'])
+        check(f'{label}: complete rows are valid', targets[0].err == '' and targets[3].err == '')
+        for t, field in ((targets[1], 'Ra'), (targets[2], 'Dec')):
+            check(f'{label}: empty {field.lower()} is an error',
+                  isinstance(t.err, str) and t.err.startswith(f'{field} invalid'))
+            check(f'{label}: empty {field.lower()} keeps its coord',
+                  isinstance(t.coord, str) and t.coord.strip() != '')
+
+    if failures:
+        print('\nFAIL:\n' + '\n'.join(failures))
+        sys.exit(1)
+    print('\nOK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Check that response_cache.cached_response only caches successful
+responses: an error page (4xx/5xx) must reach the client without an
+ETag and must not take a cache entry, while a 200 is cached, gets an
+ETag and is answered with a 304 on If-None-Match.  Exits with 1 if any
+check fails.
+
+    python benchmarks/check_response_cache.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, make_response, request
+
+from app.main import response_cache
+from app.main.response_cache import cached_response
+
+
+def make_app():
+    """A bare application with one cached view answering with the posted status."""
+    app = Flask(__name__)
+
+    @app.route('/view', methods=['POST'])
+    @cached_response
+    def view():
+        status = int(request.form.get('status', 200))
+        return make_response(f'status {status}', status)
+
+    return app
+
+def main():
+
+    client = make_app().test_client()
+    failures = []
+
+    def check(label, ok):
+        print(f'{label:>26}: {"ok" if ok else "FAIL"}')
+        if not ok:
+            failures.append(label)
+
+    for status in (400, 404, 500):
+        before = response_cache.cache_stats()['entries']
+        res = client.post('/view', data=dict(status=status))
+        check(f'{status} passes through', res.status_code == status)
+        check(f'{status} has no ETag', res.headers.get('ETag') is None)
+        check(f'{status} is not cached', response_cache.cache_stats()['entries'] == before)
+
+    res = client.post('/view', data=dict(status=200))
+    etag = res.headers.get('ETag')
+    check('200 has an ETag', etag is not None)
+    check('200 is cached', response_cache.cache_stats()['entries'] == 1)
+
+    res = client.post('/view', data=dict(status=200), headers={'If-None-Match': etag})
+    check('If-None-Match gets a 304', res.status_code == 304)
+
+    if failures:
+        print('\nFAIL:\n' + '\n'.join(failures))
+        sys.exit(1)
+    print('\nOK')
+
+
+if __name__ == '__main__':
+    main()
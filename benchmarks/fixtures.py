@@ -0,0 +1,73 @@
+"""
+Synthetic, reproducible inputs for the benchmarks: the same seed and
+size always give the same targets, in each of the upload formats.
+"""
+import numpy as np
+
+SEED = 0
+
+
+def random_coords(num, seed=SEED):
+    """RA in degrees and Dec in degrees of `num` targets visible from Mauna Kea."""
+    rng = np.random.default_rng(seed)
+    ra = rng.uniform(0.0, 360.0, num)
+    dec = rng.uniform(-30.0, 89.0, num)
+    return ra, dec
+
+def sexagesimal(val, precision=2):
+    # round first, so that the seconds never print as 60
+    m, s = divmod(round(abs(val) * 3600.0, precision), 60.0)
+    d, m = divmod(m, 60.0)
+    width = 3 + precision
+    return f'{int(d):02d}:{int(m):02d}:{s:0{width}.{precision}f}'
+
+def hms(ra_deg):
+    return sexagesimal(ra_deg / 15.0, precision=3)
+
+def dms(dec_deg):
+    return ('-' if dec_deg < 0 else '+') + sexagesimal(dec_deg)
+
+def text_targets(num, seed=SEED):
+    """The /text form's target field: 'name ra dec' lines."""
+    ra, dec = random_coords(num, seed)
+    return "\r\n".join(f'T{i} {hms(r)} {dms(d)}' for i, (r, d) in enumerate(zip(ra, dec)))
+
+def csv_targets(num, seed=SEED, header=True):
+    """A catalog csv with name, ra, dec (sexagesimal) and equinox."""
+    ra, dec = random_coords(num, seed)
+    lines = ['name,ra,dec,equinox'] if header else []
+    lines.extend(f'T{i},{hms(r)},{dms(d)},2000.0' for i, (r, d) in enumerate(zip(ra, dec)))
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+def ope_targets(num, seed=SEED):
+    """An ope file defining one target per parameter."""
+    ra, dec = random_coords(num, seed)
+    params = [f'TGT_T{i}=OBJECT="T{i}" RA={hms(r).replace(":", "")} DEC={dms(d).replace(":", "")} EQUINOX=2000.0'
+              for i, (r, d) in enumerate(zip(ra, dec))]
+    return "\n".join(['<Header>',
+                      'OBSERVATION_FILE_NAME=BENCH.ope',
+                      'OBSERVATION_FILE_TYPE=OPE',
+                      '</Header>',
+                      '',
+                      '<Parameter_List>',
+                      *params,
+                      '</Parameter_List>',
+                      '',
+                      '<Command>',
+                      '</Command>',
+                      ''])
+
+def laser_targets(num, date='2019-06-28', windows=4, seed=SEED):
+    """A laser clearinghouse predictions file with `windows` safe windows per target."""
+    ra, dec = random_coords(num, seed)
+    rng = np.random.default_rng(seed)
+    lines = [date]
+    for i, (r, d) in enumerate(zip(ra, dec)):
+        # windows between 19:00 and 29:00 (05:00 the next day)
+        starts = np.sort(rng.integers(19 * 3600, 29 * 3600, windows))
+        spans = []
+        for s in starts:
+            e = s + int(rng.integers(60, 1800))
+            spans.append(f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}-{e // 3600:02d}:{e // 60 % 60:02d}:{e % 60:02d}')
+        lines.append(f'T{i} {r:.6f} {d:.6f} ' + ' '.join(spans))
+    return ("\n".join(lines) + "\n").encode('utf-8')
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Check the cold start of the app against a budget: import it in a fresh
+interpreter, fail if that takes longer than --budget seconds (best of
+--repeat runs) or if it loads a module the routes import lazily.
+
+    python benchmarks/import_time.py --budget 5
+"""
+import os
+import sys
+import json
+import subprocess
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# must not be loaded by importing the app; see helper_func.py and image.py
+LAZY_MODULES = ['pandas', 'matplotlib', 'oscript']
+
+# run in the child interpreter
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps(dict(seconds=elapsed, modules=sorted(sys.modules))))
+"""
+
+
+def probe():
+    """Import the app in a new interpreter; returns (seconds, module names)."""
+    res = subprocess.run([sys.executable, '-c', PROBE], capture_output=True, text=True,
+                         cwd=ROOT, check=True)
+    res = json.loads(res.stdout.strip().splitlines()[-1])
+    return res['seconds'], res['modules']
+
+def main(options, args):
+
+    times = []
+    for _ in range(options.repeat):
+        seconds, modules = probe()
+        times.append(seconds)
+
+    best = min(times)
+    print(f'import app.main: best {best:.3f}s of {options.repeat}, budget {options.budget:.3f}s')
+
+    failed = False
+    loaded = [name for name in LAZY_MODULES if name in modules]
+    if loaded:
+        print(f'FAIL: loaded at import: {", ".join(loaded)}')
+        failed = True
+
+    if best > options.budget:
+        print(f'FAIL: over budget by {best - options.budget:.3f}s')
+        failed = True
+
+    if options.verbose:
+        print('\n'.join(modules))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+
+    argprs = ArgumentParser(description="tgtvis import time budget")
+
+    argprs.add_argument("--budget", dest="budget", default=5.0, type=float,
+                        help="seconds allowed to import the app (default %(default)s)")
+    argprs.add_argument("--repeat", dest="repeat", default=3, type=int,
+                        help="fresh interpreters to try (default %(default)s)")
+    argprs.add_argument("-v", "--verbose", dest="verbose", default=False, action="store_true",
+                        help="list the imported modules")
+
+    (options, args) = argprs.parse_known_args(sys.argv[1:])
+
+    main(options, args)
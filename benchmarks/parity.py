@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+Check that the batch trajectory engine (trajectory.compute_trajectories)
+gives the same altitude, azimuth, airmass and moon separation as
+qplan's per-target get_target_info, on targets that cover the awkward
+cases: low altitudes, circumpolar and never-rising targets, a target
+near the zenith and a B1950 target.  Exits with 1 if any difference is
+over the tolerance.
+
+    python benchmarks/parity.py --date 2019-06-28
+
+Neither side applies refraction (both use skyfield's altaz() without
+temperature and pressure), so the expected differences are only the
+engine's shared-frame approximation: differential aberration, below
+21 arcsec.  Airmass is compared above MIN_AIRMASS_ALT degrees only,
+where both are finite and well conditioned; below the horizon the
+engine must report NaN.
+"""
+import os
+import sys
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from qplan.util.site import get_site
+from qplan.entity import StaticTarget
+from ginga.misc import Bunch
+
+from app.main import trajectory
+from app.main.context import observing_context
+
+# name, ra, dec, equinox
+TARGETS = [('zenith', '18:00:00.00', '+19:49:00.0', 2000.0),
+           ('low_south', '16:30:00.00', '-45:00:00.0', 2000.0),
+           ('horizon_grazer', '12:00:00.00', '-60:00:00.0', 2000.0),
+           ('never_rises', '06:00:00.00', '-80:00:00.0', 2000.0),
+           ('circumpolar', '02:31:49.09', '+89:15:50.8', 2000.0),
+           ('circumpolar_low', '10:00:00.00', '+75:00:00.0', 2000.0),
+           ('setting', '12:30:00.00', '+12:00:00.0', 2000.0),
+           ('rising', '23:00:00.00', '+30:00:00.0', 2000.0),
+           ('b1950', '17:42:29.30', '-28:59:18.0', 1950.0)]
+
+# arcseconds
+TOLERANCE = 30.0
+# airmass is compared above this altitude, in degrees
+MIN_AIRMASS_ALT = 5.0
+# relative airmass tolerance
+AIRMASS_RTOL = 1e-3
+
+
+def compare(name, batch, ref, options):
+    """Return a list of failure messages for one target."""
+    tol = options.tolerance / 3600.0
+    alt, ref_alt = batch.alt_deg, np.asarray(ref.alt_deg, dtype=float)
+    failures = []
+
+    def check(label, diff, limit):
+        worst = np.nanmax(np.abs(diff)) if np.size(diff) else 0.0
+        print(f'{name:>16} {label:>9} max diff {worst:.6f} (limit {limit:.6f})')
+        if worst > limit:
+            failures.append(f'{name}: {label} differs by {worst:.6f} > {limit:.6f}')
+
+    check('alt', alt - ref_alt, tol)
+
+    # azimuth: wrap around and scale by cos(alt), meaningless at the zenith
+    daz = (batch.az_deg - np.asarray(ref.az_deg, dtype=float) + 180.0) % 360.0 - 180.0
+    high = ref_alt > 89.0
+    check('az', np.where(high, 0.0, daz * np.cos(np.radians(ref_alt))), tol)
+
+    check('moon_sep', batch.moon_sep - np.asarray(ref.moon_sep, dtype=float), tol)
+
+    up = ref_alt > MIN_AIRMASS_ALT
+    ref_airmass = np.asarray(ref.airmass, dtype=float)
+    check('airmass', (batch.airmass[up] - ref_airmass[up]) / ref_airmass[up], AIRMASS_RTOL)
+
+    down = alt < 0
+    if not np.all(np.isnan(batch.airmass[down])):
+        failures.append(f'{name}: airmass below the horizon is not NaN')
+
+    return failures
+
+def main(options, args):
+
+    site = get_site(options.site)
+    ctx = observing_context(site, options.date)
+    # get_target_info still takes its date from the site
+    site.set_date(ctx.date)
+
+    targets = [Bunch.Bunch(name=name, ra=ra, dec=dec, equinox=equinox)
+               for name, ra, dec, equinox in TARGETS]
+    batch = trajectory.compute_trajectories(ctx, targets, time_interval=options.time_interval,
+                                            parallel=False)
+
+    failures = []
+    for i, tgt in enumerate(targets):
+        ref = site.get_target_info(StaticTarget(name=tgt.name, ra=tgt.ra, dec=tgt.dec, equinox=tgt.equinox),
+                                   time_start=batch.ut[0], time_stop=batch.ut[-1],
+                                   time_interval=options.time_interval)
+        if len(ref.alt_deg) != len(batch.ut):
+            failures.append(f'{tgt.name}: {len(ref.alt_deg)} samples from qplan, {len(batch.ut)} from the engine')
+            continue
+        failures.extend(compare(tgt.name, batch.target_calc(i), ref, options))
+
+    moon_alt = np.asarray(ref.moon_alt, dtype=float)
+    worst = np.max(np.abs(batch.moon_alt - moon_alt))
+    print(f'{"moon":>16} {"alt":>9} max diff {worst:.6f}')
+    if worst > options.tolerance / 3600.0:
+        failures.append(f'moon altitude differs by {worst:.6f}')
+
+    if failures:
+        print('\nFAIL:\n' + '\n'.join(failures))
+        sys.exit(1)
+    print('\nOK')
+
+
+if __name__ == '__main__':
+
+    argprs = ArgumentParser(description="trajectory engine vs. qplan get_target_info")
+
+    argprs.add_argument("--site", dest="site", default="subaru",
+                        help="site (default %(default)s)")
+    argprs.add_argument("--date", dest="date", default="2019-06-28",
+                        help="observing date (default %(default)s)")
+    argprs.add_argument("--time-interval", dest="time_interval", default=5, type=int,
+                        help="time step in minutes (default %(default)s)")
+    argprs.add_argument("--tolerance", dest="tolerance", default=TOLERANCE, type=float,
+                        help="allowed angular difference in arcsec (default %(default)s)")
+
+    (options, args) = argprs.parse_known_args(sys.argv[1:])
+
+    main(options, args)
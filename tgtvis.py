@@ -75,7 +75,12 @@ else:
 
     loghome = os.environ.get('LOGHOME', '/tmp')
     options.logfile = os.path.join(loghome, 'tgtvis.log')
-    options.loglevel = logging.DEBUG
+    # debug logging formats every target of every request; opt in with
+    # TGTVIS_LOGLEVEL=DEBUG (or 10)
+    level = os.environ.get('TGTVIS_LOGLEVEL', 'INFO').strip()
+    options.loglevel = int(level) if level.isdigit() else logging.getLevelName(level.upper())
+    if not isinstance(options.loglevel, int):
+        raise ValueError(f'unknown TGTVIS_LOGLEVEL. {level}')
 
     # TODO: Can we set config_name to 'production'?
     config_name = os.environ.get('TGTVIS_CONFIG_NAME', 'development')
@@ -84,4 +89,17 @@ else:
 
     tgtvis_app = create_app(config_name, logger)
 
+    # load the ephemerides and lazily imported modules before the server
+    # forks its workers; TGTVIS_WARMUP=0 skips it.  A failure only costs
+    # the warmup: the first requests load what they need.
+    if os.environ.get('TGTVIS_WARMUP', '1') != '0':
+        try:
+            try:
+                from app.main.warmup import warmup
+            except ModuleNotFoundError as e:
+                from .app.main.warmup import warmup
+            warmup(logger)
+        except Exception as e:
+            logger.error(f'Error: warmup failed, continuing without it. {e}', exc_info=True)
+
 # END